@@ -4,35 +4,51 @@ from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
 from flask_mail import Mail
-from flask_session import Session
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import os
 
 from config import Config
 from models import db
+from database import READ_PRIMARY_HEADER, init_read_your_writes
+from compression import init_compression
+from sessions import init_sessions
+from ratelimit import init_rate_limiting
+from sharding import init_sharding
 from routes import routes_bp  # Import the Blueprint from routes.py
+from jobs import jobs_bp  # CLI commands for periodic jobs
 
 load_dotenv()
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
+# Take the client address from the proxies' forwarded headers, see TRUSTED_PROXY_HOPS
+if Config.TRUSTED_PROXY_HOPS:
+    hops = Config.TRUSTED_PROXY_HOPS
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
 # Initialize extensions
-Session(app)
 db.init_app(app)
+init_sessions(app, db)  # Stateless by default, see SESSION_TYPE
+init_read_your_writes(app)  # Replica reads resume once the client's writes have replicated
 bcrypt = Bcrypt(app)  # Initialize Bcrypt
 jwt = JWTManager(app)
 mail = Mail(app)
 migrate = Migrate(app, db)  # Initialize Flask-Migrate
+init_compression(app)  # Brotli/gzip response compression
+init_rate_limiting(app)  # Token buckets for the auth routes
+init_sharding(app)  # Shard map and tenant tables on every shard
 
 # CORS settings
-CORS(app, supports_credentials=True, origins=[Config.FRONTEND_URL])
+CORS(app, supports_credentials=True, origins=[Config.FRONTEND_URL], expose_headers=[READ_PRIMARY_HEADER])
 
 # Register Blueprint for routes
 app.register_blueprint(routes_bp)
+app.register_blueprint(jobs_bp)
 
-# Create database tables
+# Create database tables (tenant tables and their search index are set up by init_sharding)
 with app.app_context():
     db.create_all()
 
@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+
+from models import db, Invoice, InvoiceItem, InvoiceStatus, ArchivedInvoice, ArchivedInvoiceItem
+from sharding import moving_user_ids
+
+SETTLED_STATUSES = [InvoiceStatus.PAID, InvoiceStatus.CANCELLED]
+
+def _copy_rows(source, target, where):
+    """ INSERT INTO target (...) SELECT ... FROM source WHERE ..., column for column """
+    columns = [column.name for column in source.__table__.columns]
+    return insert(target.__table__).from_select(
+        columns,
+        db.select(*[source.__table__.c[name] for name in columns]).where(where),
+    )
+
+def archive_settled_invoices(older_than_days, batch_size, today=None):
+    """
+    Moves paid and cancelled invoices whose due date is more than older_than_days
+    in the past, with their items, into the archive tables. Each batch is copied
+    and deleted in its own transaction. Returns the number of invoices archived.
+    """
+    cutoff = (today or date.today()) - timedelta(days=older_than_days)
+    archived = 0
+    while True:
+        # Served by the (status, due_date) index; tenants being moved are left for the next run
+        ids = db.session.execute(
+            db.select(Invoice.id)
+            .where(Invoice.status.in_(SETTLED_STATUSES), Invoice.due_date < cutoff)
+            .where(Invoice.user_id.not_in(moving_user_ids()))
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return archived
+
+        db.session.execute(_copy_rows(Invoice, ArchivedInvoice, Invoice.id.in_(ids)))
+        db.session.execute(_copy_rows(InvoiceItem, ArchivedInvoiceItem, InvoiceItem.invoice_id.in_(ids)))
+        db.session.execute(
+            db.delete(InvoiceItem).where(InvoiceItem.invoice_id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            db.delete(Invoice).where(Invoice.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        archived += len(ids)
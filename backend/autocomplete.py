@@ -0,0 +1,89 @@
+import threading
+from bisect import bisect_left, insort
+
+from cachetools import TTLCache
+
+from config import Config
+
+# -------------------- Prefix Index --------------------
+class ClientPrefixIndex:
+    """
+    Sorted array of (key, client_id) pairs for one user's clients, searched with
+    bisect. Every word of the client's name and business name starts a key, so
+    "ltd" matches "Acme Ltd" as well as "Ltd Holdings".
+    """
+
+    def __init__(self, clients=()):
+        self._keys = []
+        self._clients = {}
+        for client in clients:
+            self._clients[client.id] = (client.name, client.business_name)
+            self._keys.extend((key, client.id) for key in self._keys_for(client.name, client.business_name))
+        self._keys.sort()
+
+    @staticmethod
+    def _keys_for(*values):
+        keys = set()
+        for value in values:
+            words = (value or "").lower().split()
+            keys.update(" ".join(words[i:]) for i in range(len(words)))
+        return keys
+
+    def upsert(self, client):
+        """ Adds a client, or re-indexes it if its names changed """
+        old = self._clients.get(client.id)
+        new = (client.name, client.business_name)
+        if old == new:
+            return
+        if old is not None:
+            for key in self._keys_for(*old):
+                i = bisect_left(self._keys, (key, client.id))
+                if i < len(self._keys) and self._keys[i] == (key, client.id):
+                    del self._keys[i]
+        for key in self._keys_for(*new):
+            insort(self._keys, (key, client.id))
+        self._clients[client.id] = new
+
+    def lookup(self, prefix, limit):
+        """ Returns up to `limit` clients with a name word starting with `prefix` """
+        prefix = " ".join(prefix.lower().split())
+        results, seen = [], set()
+        i = bisect_left(self._keys, (prefix,))
+        while i < len(self._keys) and len(results) < limit:
+            key, client_id = self._keys[i]
+            if not key.startswith(prefix):
+                break
+            if client_id not in seen:
+                seen.add(client_id)
+                name, business_name = self._clients[client_id]
+                results.append({"id": client_id, "name": name, "business_name": business_name})
+            i += 1
+        return results
+
+# -------------------- Per-user Cache --------------------
+# Indexes are keyed by JWT identity so a cache hit needs no database access.
+# The TTL bounds staleness from writes handled by other workers.
+_indexes = TTLCache(maxsize=Config.AUTOCOMPLETE_MAX_USERS, ttl=Config.AUTOCOMPLETE_TTL_SECONDS)
+_indexes_lock = threading.Lock()
+
+def lookup(identity, prefix, limit, load_clients):
+    """
+    Returns the user's clients matching `prefix`, building the index from
+    load_clients() on a cache miss.
+    """
+    with _indexes_lock:
+        index = _indexes.get(identity)
+        if index is not None:
+            return index.lookup(prefix, limit)
+
+    index = ClientPrefixIndex(load_clients())
+    with _indexes_lock:
+        _indexes[identity] = index
+        return index.lookup(prefix, limit)
+
+def client_changed(identity, client):
+    """ Applies a created or updated client to the user's index, if one is cached """
+    with _indexes_lock:
+        index = _indexes.get(identity)
+        if index is not None:
+            index.upsert(client)
@@ -0,0 +1,97 @@
+"""
+Benchmark: GET /invoices latency over hot data as the settled history grows,
+with the history left in the hot tables versus moved to the archive.
+
+Usage (from the backend directory):
+    python benchmarks/archive_listing.py [--hot 500] [--sizes 0,2000,10000,25000] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# Point the app at a throwaway SQLite database before config.py reads the environment
+_workdir = tempfile.mkdtemp()
+os.environ["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(_workdir, 'bench.db')}"
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("JWT_SECRET_KEY", "bench-jwt-secret-key-with-enough-length")
+os.environ.setdefault("FRONTEND_URL", "http://localhost:3000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app import app  # noqa: E402
+from archive import archive_settled_invoices  # noqa: E402
+from models import (  # noqa: E402
+    db, User, Client, Invoice, InvoiceItem, ArchivedInvoice, ArchivedInvoiceItem,
+    Currency, InvoiceStatus, PaymentMethod, ItemType, ItemUnit,
+)
+
+def seed(user_id, client_id, start_number, count, status, due_date):
+    """ Bulk-inserts `count` one-item invoices """
+    if not count:
+        return
+    invoice_ids = db.session.execute(insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True), [{
+        "user_id": user_id, "client_id": client_id, "invoice_number": str(start_number + i),
+        "issue_date": due_date - timedelta(days=30), "due_date": due_date, "currency": Currency.USD,
+        "tax_rate": 0.0, "subtotal": 100.0, "total_discount": 0.0, "tax_amount": 0.0, "total_amount": 100.0,
+        "status": status, "payment_method": PaymentMethod.BANK_TRANSFER, "payment_details": "bench",
+    } for i in range(count)]).scalars().all()
+    db.session.execute(insert(InvoiceItem), [{
+        "invoice_id": invoice_id, "item_type": ItemType.SERVICE, "description": "Consulting",
+        "quantity": 1.0, "unit": ItemUnit.HOUR, "rate": 100.0, "discount": 0.0,
+        "gross_amount": 100.0, "net_amount": 100.0,
+    } for invoice_id in invoice_ids])
+    db.session.commit()
+
+def reset():
+    for model in (ArchivedInvoiceItem, ArchivedInvoice, InvoiceItem, Invoice, Client, User):
+        db.session.execute(db.delete(model))
+    db.session.commit()
+
+def time_listing(client, headers, runs, query=""):
+    """ Median wall time of GET /invoices in milliseconds """
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = client.get(f"/invoices{query}", headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hot", type=int, default=500, help="Open invoices in the account")
+    parser.add_argument("--sizes", default="0,2000,10000,25000", help="Settled history sizes to test")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    print(f"{'history':>8} | {'hot tables (ms)':>15} | {'archived (ms)':>13} | {'include_archived (ms)':>21}")
+    for size in [int(value) for value in args.sizes.split(",")]:
+        with app.app_context():
+            reset()
+            user = User(username="bench", name="Bench", email="bench@example.com", is_verified=True)
+            db.session.add(user)
+            db.session.flush()
+            account = Client(user_id=user.id, name="Client", email="client@example.com")
+            db.session.add(account)
+            db.session.commit()
+
+            headers = {"Authorization": f"Bearer {create_access_token(identity='bench')}"}
+            seed(user.id, account.id, 1, size, InvoiceStatus.PAID, date.today() - timedelta(days=3650))
+            seed(user.id, account.id, size + 1, args.hot, InvoiceStatus.UNPAID, date.today() + timedelta(days=30))
+
+        unarchived = time_listing(client, headers, args.runs)
+        with app.app_context():
+            archive_settled_invoices(older_than_days=365, batch_size=1000)
+        archived = time_listing(client, headers, args.runs)
+        with_archive = time_listing(client, headers, args.runs, "?include_archived=true")
+        print(f"{size:>8} | {unarchived:>15.1f} | {archived:>13.1f} | {with_archive:>21.1f}")
+
+if __name__ == "__main__":
+    main()
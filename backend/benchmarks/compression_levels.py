@@ -0,0 +1,68 @@
+"""
+Benchmark: bytes on the wire and CPU cost per brotli quality and gzip level for
+a GET /invoices-shaped JSON payload (every invoice with nested items).
+
+Usage (from the backend directory):
+    python benchmarks/compression_levels.py [--invoices 2000] [--items 4] [--runs 3]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import compress  # noqa: E402
+
+def build_payload(invoices, items):
+    """ Synthetic response body with the same shape as GET /invoices """
+    rng = random.Random(42)
+    descriptions = ["Logo redesign", "Consulting", "Website maintenance", "Copywriting", "Hosting"]
+    payload = []
+    for number in range(1, invoices + 1):
+        issue_date = date(2020, 1, 1) + timedelta(days=rng.randrange(2000))
+        lines = []
+        for item_id in range(items):
+            quantity, rate = rng.randrange(1, 40), rng.choice([50.0, 75.0, 120.0])
+            lines.append({
+                "id": number * items + item_id, "type": "Service", "description": rng.choice(descriptions),
+                "quantity": float(quantity), "unit": "Hour", "rate": rate, "discount": 0.0,
+                "gross_amount": quantity * rate, "net_amount": quantity * rate,
+            })
+        subtotal = sum(line["net_amount"] for line in lines)
+        payload.append({
+            "id": number, "user_id": 1, "client_id": rng.randrange(1, 50), "invoice_number": str(number),
+            "client": f"Client {rng.randrange(1, 50)}", "issue_date": issue_date.isoformat(),
+            "due_date": (issue_date + timedelta(days=30)).isoformat(), "currency": "USD", "tax_rate": 20.0,
+            "subtotal": subtotal, "total_discount": 0.0, "tax_amount": subtotal * 0.2,
+            "total_amount": subtotal * 1.2, "status": rng.choice(["Paid", "Unpaid", "Overdue"]),
+            "payment_method": "Bank Transfer", "payment_details": "IBAN GB00 0000 0000 0000",
+            "payment_date": None, "archived": False, "items": lines,
+        })
+    return json.dumps(payload).encode("utf-8")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    data = build_payload(args.invoices, args.items)
+    print(f"Uncompressed: {len(data):,} bytes")
+    print(f"{'encoding':>8} | {'level':>5} | {'bytes':>10} | {'ratio':>6} | {'CPU ms':>8}")
+
+    levels = [("gzip", level) for level in range(1, 10)] + [("br", quality) for quality in range(0, 12)]
+    for encoding, level in levels:
+        timings = []
+        for _ in range(args.runs):
+            started = time.process_time()
+            compressed = compress(data, encoding, level)
+            timings.append((time.process_time() - started) * 1000)
+        print(f"{encoding:>8} | {level:>5} | {len(compressed):>10,} | {len(data) / len(compressed):>6.1f} | {min(timings):>8.1f}")
+
+if __name__ == "__main__":
+    main()
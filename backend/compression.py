@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import threading
+import zlib
+from functools import partial
+
+import brotli
+from cachetools import LRUCache
+from flask import request
+
+# Precompressed bodies of large responses, bounded by total compressed bytes
+_precompressed = None
+_precompressed_lock = threading.Lock()
+
+# -------------------- Helper Functions --------------------
+def _accepted_encodings(header):
+    """ Returns the encodings the client accepts with a non-zero q-value """
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+def choose_encoding(header):
+    """ Picks brotli when accepted, otherwise gzip, otherwise None """
+    accepted = _accepted_encodings(header or "")
+    if "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def compression_level(config, mimetype, encoding):
+    """ Level for the content type from COMPRESS_LEVELS, falling back to the defaults """
+    levels = config["COMPRESS_LEVELS"].get(mimetype, {})
+    default = config["COMPRESS_BR_QUALITY"] if encoding == "br" else config["COMPRESS_GZIP_LEVEL"]
+    return levels.get(encoding, default)
+
+def compress(data, encoding, level):
+    """ Compresses a whole body """
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def compress_stream(chunks, encoding, level, flush_bytes):
+    """
+    Compresses a streamed body incrementally, flushing whenever flush_bytes of
+    input have accumulated so the client keeps receiving data.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+        process, finish = compressor.compress, compressor.flush
+        flush = partial(compressor.flush, zlib.Z_SYNC_FLUSH)
+
+    pending = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        output = process(chunk)
+        pending += len(chunk)
+        if pending >= flush_bytes:
+            output += flush()
+            pending = 0
+        if output:
+            yield output
+    yield finish()
+
+def _compress_cached(config, data, encoding, level):
+    """
+    Compresses large bodies through a content-addressed cache, so an unchanged
+    large payload (e.g. a full invoice export) is compressed only once.
+    """
+    if len(data) < config["COMPRESS_CACHE_MIN_SIZE"]:
+        return compress(data, encoding, level)
+
+    key = (hashlib.sha256(data).hexdigest(), encoding, level)
+    with _precompressed_lock:
+        cached = _precompressed.get(key)
+    if cached is None:
+        cached = compress(data, encoding, level)
+        with _precompressed_lock:
+            if len(cached) <= _precompressed.maxsize:
+                _precompressed[key] = cached
+    return cached
+
+# -------------------- Middleware --------------------
+def init_compression(app):
+    """ Registers negotiated brotli/gzip compression for the app's responses """
+    global _precompressed
+    _precompressed = LRUCache(maxsize=app.config["COMPRESS_CACHE_MAX_BYTES"], getsizeof=len)
+
+    @app.after_request
+    def compress_response(response):
+        config = app.config
+        if not config["COMPRESS_ENABLED"]:
+            return response
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        if response.direct_passthrough or "Content-Encoding" in response.headers:
+            return response
+        if response.mimetype not in config["COMPRESS_MIMETYPES"]:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+        level = compression_level(config, response.mimetype, encoding)
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, level, config["COMPRESS_STREAM_FLUSH_BYTES"])
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < config["COMPRESS_MIN_SIZE"]:
+                return response
+            response.set_data(_compress_cached(config, data, encoding, level))
+
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -6,6 +6,28 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def engine_options(uri, prefix):
+    """
+    Builds SQLAlchemy engine options for one bind from environment variables
+    named with the given prefix (e.g. DB_POOL_SIZE, REPLICA_POOL_SIZE).
+    """
+    options = {
+        "pool_pre_ping": os.getenv(f"{prefix}_POOL_PRE_PING", "True") == "True",
+        "pool_recycle": int(os.getenv(f"{prefix}_POOL_RECYCLE", 1800)),
+    }
+
+    # In-memory SQLite uses a single static connection, so pool sizing does not apply
+    if uri and not (uri.startswith("sqlite") and ":memory:" in uri):
+        options["pool_size"] = int(os.getenv(f"{prefix}_POOL_SIZE", 5))
+        options["max_overflow"] = int(os.getenv(f"{prefix}_MAX_OVERFLOW", 10))
+
+    # Statement timeouts are enforced server-side (PostgreSQL only)
+    statement_timeout = int(os.getenv(f"{prefix}_STATEMENT_TIMEOUT_MS", 0))
+    if statement_timeout and uri and uri.startswith("postgresql"):
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+
+    return options
+
 class Config:
     # Frontend URL
     FRONTEND_URL = os.getenv("FRONTEND_URL")
@@ -14,11 +36,104 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")
     SQLALCHEMY_DATABASE_URI = os.getenv("SQLALCHEMY_DATABASE_URI")
     SQLALCHEMY_TRACK_MODIFICATIONS = os.getenv("SQLALCHEMY_TRACK_MODIFICATIONS") == "True"
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, "DB")
+
+    # Read replicas (comma-separated URIs), registered as binds "replica_0", "replica_1", ...
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.getenv("SQLALCHEMY_REPLICA_URIS", "").split(",") if uri]
+    # Tenant shards (comma-separated URIs), registered as binds "shard_0", "shard_1", ...
+    # The primary keeps the user directory and the shard map, and is itself shard "default"
+    SQLALCHEMY_SHARD_URIS = [uri for uri in os.getenv("SQLALCHEMY_SHARD_URIS", "").split(",") if uri]
+    SQLALCHEMY_BINDS = {
+        **{f"replica_{i}": {"url": uri, **engine_options(uri, "REPLICA")} for i, uri in enumerate(SQLALCHEMY_REPLICA_URIS)},
+        **{f"shard_{i}": {"url": uri, **engine_options(uri, "SHARD")} for i, uri in enumerate(SQLALCHEMY_SHARD_URIS)},
+    }
+    # Seconds a user's reads stay on the primary after they write (read-your-writes)
+    REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+    REPLICA_STICKY_MAX_USERS = int(os.getenv("REPLICA_STICKY_MAX_USERS", 10000))  # Recent writers tracked per process
+    # Shards new tenants are spread over (comma-separated, default: all of them)
+    SHARD_PLACEMENT = [
+        name for name in os.getenv("SHARD_PLACEMENT", "").split(",") if name
+    ] or ["default"] + [f"shard_{i}" for i in range(len(SQLALCHEMY_SHARD_URIS))]
+    SHARD_MAP_CACHE_SIZE = int(os.getenv("SHARD_MAP_CACHE_SIZE", 10000))  # Identities with a cached shard
+    SHARD_MAP_CACHE_TTL_SECONDS = int(os.getenv("SHARD_MAP_CACHE_TTL_SECONDS", 30))
+    # Ids each shard assigns: the primary 1..N, shard_0 N+1..2N, and so on, so moved rows keep their ids
+    SHARD_ID_RANGE = int(os.getenv("SHARD_ID_RANGE", 100_000_000))
+    SHARD_MOVE_BATCH_SIZE = int(os.getenv("SHARD_MOVE_BATCH_SIZE", 1000))  # Rows copied or deleted per statement
+    SHARD_MOVE_SETTLE_SECONDS = int(os.getenv("SHARD_MOVE_SETTLE_SECONDS", 2))  # Lets in-flight writes finish
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
     
-    # Session config
-    SESSION_TYPE = os.getenv("SESSION_TYPE", "filesystem")
+    # Session config: "null" keeps the API stateless; "sqlalchemy" or "cachelib" give a
+    # shared server-side store that requests with a JWT bearer token never touch
+    SESSION_TYPE = os.getenv("SESSION_TYPE", "null")
     SESSION_PERMANENT = False
+    SESSION_KEY_PREFIX = "session:"
+    SESSION_SQLALCHEMY_TABLE = "sessions"
+    SESSION_CACHELIB_URL = os.getenv("SESSION_CACHELIB_URL")  # e.g. redis://cache:6379/0
+    SESSION_PRUNE_BATCH_SIZE = int(os.getenv("SESSION_PRUNE_BATCH_SIZE", 1000))
+
+    # One-time tokens (email verification and password reset)
+    VERIFICATION_TOKEN_TTL_HOURS = int(os.getenv("VERIFICATION_TOKEN_TTL_HOURS", 48))
+    PASSWORD_RESET_TOKEN_TTL_MINUTES = int(os.getenv("PASSWORD_RESET_TOKEN_TTL_MINUTES", 60))
+    TOKEN_PURGE_BATCH_SIZE = int(os.getenv("TOKEN_PURGE_BATCH_SIZE", 1000))
+
+    # Payment reminders
+    REMINDER_LEAD_DAYS = int(os.getenv("REMINDER_LEAD_DAYS", 3))  # Remind this many days before the due date
+    REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 50))  # Emails sent per SMTP connection
+
+    # Recurring invoices
+    RECURRING_BATCH_SIZE = int(os.getenv("RECURRING_BATCH_SIZE", 500))  # Templates per transaction
+
+    # Bulk invoice updates
+    BULK_MAX_INVOICES = int(os.getenv("BULK_MAX_INVOICES", 1000))  # Invoice ids accepted per request
+
+    # Archival of settled invoices
+    ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 730))  # Days past the due date
+    ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))  # Invoices moved per transaction
+
+    # /metrics/* endpoints, which expose internal pool and rate limiter state; keep them off on public hosts
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False") == "True"
+
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto/-Host headers are trusted;
+    # 0 when clients connect directly, so remote_addr (and the rate limits' IP buckets) is the client
+    TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+
+    # Rate limiting of the auth routes: token buckets of (capacity, refill period in seconds)
+    RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "True") == "True"
+    RATELIMIT_STORAGE_URL = os.getenv("RATELIMIT_STORAGE_URL", "memory://")  # redis://... to share across workers
+    RATELIMIT_MAX_KEYS = int(os.getenv("RATELIMIT_MAX_KEYS", 100000))  # Buckets held by the in-memory store
+    RATELIMIT_LIMITS = {
+        "login": {"ip": (20, 60), "account": (5, 300)},
+        "register": {"ip": (5, 3600), "account": (3, 3600)},
+        "recover-password": {"ip": (5, 900), "account": (3, 3600)},
+        "login-google": {"ip": (20, 60)},
+    }
+
+    # Idempotency keys (POST /invoice, POST /client)
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))  # How long responses are replayed
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))  # In-process LRU entries
+    IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 60))  # In-flight claim before takeover
+
+    # Response compression (brotli preferred, gzip fallback)
+    COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "True") == "True"
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))  # Smaller bodies are sent as-is
+    COMPRESS_BR_QUALITY = int(os.getenv("COMPRESS_BR_QUALITY", 4))
+    COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+    COMPRESS_MIMETYPES = ["application/json", "text/html", "text/plain", "text/csv"]
+    COMPRESS_LEVELS = {  # Per content type overrides of the levels above
+        "application/json": {"br": 5, "gzip": 6},
+        "text/csv": {"br": 6, "gzip": 6},
+    }
+    COMPRESS_STREAM_FLUSH_BYTES = int(os.getenv("COMPRESS_STREAM_FLUSH_BYTES", 16 * 1024))  # Streamed input per flush
+    COMPRESS_CACHE_MIN_SIZE = int(os.getenv("COMPRESS_CACHE_MIN_SIZE", 256 * 1024))  # Bodies cached precompressed
+    COMPRESS_CACHE_MAX_BYTES = int(os.getenv("COMPRESS_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+    # Reports
+    REPORT_CACHE_MAX_USERS = int(os.getenv("REPORT_CACHE_MAX_USERS", 1000))
+    REPORT_CACHE_TTL_SECONDS = int(os.getenv("REPORT_CACHE_TTL_SECONDS", 60))
+
+    # Client autocomplete (per-user in-memory prefix indexes)
+    AUTOCOMPLETE_MAX_USERS = int(os.getenv("AUTOCOMPLETE_MAX_USERS", 1000))
+    AUTOCOMPLETE_TTL_SECONDS = int(os.getenv("AUTOCOMPLETE_TTL_SECONDS", 300))
 
     # Email Config (ZeptoMail)
     MAIL_SERVER = os.getenv("MAIL_SERVER")
@@ -0,0 +1,219 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from cachetools import TTLCache
+from flask import current_app, g, has_app_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql.dml import UpdateBase
+
+from config import Config
+
+REPLICA_BIND_PREFIX = "replica_"
+
+# Carries the read-your-writes deadline (epoch seconds) with the client, so it holds across workers
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_PRIMARY_HEADER = "X-Read-Primary-Until"
+
+# Users of this process who wrote recently; entries expire once their reads may use replicas again
+_recent_writers = TTLCache(maxsize=Config.REPLICA_STICKY_MAX_USERS, ttl=Config.REPLICA_STICKY_SECONDS)
+_recent_writers_lock = threading.Lock()
+
+# SQLite hands out ids above the largest one in a table, so rows copied in from another shard's
+# id range would move every later id into that range. Where SQLite is in use, tenant ids are
+# drawn from each shard's id_counter table instead (see sharding.reserve_id_range).
+USE_ID_COUNTER = any(
+    (uri or "").startswith("sqlite") for uri in [Config.SQLALCHEMY_DATABASE_URI, *Config.SQLALCHEMY_SHARD_URIS]
+)
+
+# -------------------- Helper Functions --------------------
+def next_tenant_id(context):
+    """ Column default: the table's next id from the shard's id_counter, taken in the inserting transaction """
+    return context.connection.execute(
+        text("UPDATE id_counter SET next_id = next_id + 1 WHERE table_name = :table RETURNING next_id - 1"),
+        {"table": context.current_column.table.name},
+    ).scalar_one()
+
+def _current_identity():
+    """ Returns the JWT identity of the current request, or None outside a JWT route """
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+def _mark_writer():
+    """
+    Pins the current user's reads to the primary for REPLICA_STICKY_SECONDS, in
+    this process and, through the response, on whichever worker serves them next
+    """
+    if not has_app_context():
+        return
+    g.read_primary_until = time.time() + current_app.config["REPLICA_STICKY_SECONDS"]
+    identity = _current_identity()
+    if identity is not None:
+        with _recent_writers_lock:
+            _recent_writers[identity] = True
+
+def _is_tenant_table(mapper, clause):
+    """ Checks whether the statement targets a table stored on the tenant's shard """
+    table = mapper.local_table if mapper is not None else getattr(clause, "table", None)
+    return table is not None and table.info.get("sharded", False)
+
+def _wrote_recently(identity):
+    """ Checks the deadline sent back by the client, then this process' own writers """
+    marker = request.headers.get(READ_PRIMARY_HEADER) or request.cookies.get(READ_PRIMARY_COOKIE)
+    try:
+        if marker and float(marker) > time.time():
+            return True
+    except ValueError:
+        pass
+    if identity is None:
+        return False
+    with _recent_writers_lock:
+        return identity in _recent_writers
+
+# -------------------- Routing Session --------------------
+class RoutingSession(Session):
+    """
+    Session that sends tenant tables to the current tenant's shard, and on the
+    primary sends reads to a read replica when the current route opted in with
+    @replica_reads, and everything else (writes, flushes, and any reads after a
+    write in the same session) to the primary.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._use_primary = False
+        self._replica = None
+        self._tenant_writable = False
+        self._commits_deferred = 0
+        self._after_commit = []
+
+    def _tenant_shard(self, writing):
+        """ Bind key of the current tenant's shard (None for the primary), see sharding.py """
+        sharding = current_app.extensions.get("sharding") if has_app_context() else None
+        if sharding is None:
+            return None
+        if writing and not self._tenant_writable:
+            # Checked against the directory once per session, so a tenant being moved is not written to
+            sharding.check_writable()
+            self._tenant_writable = True
+        return sharding.current_shard()
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+        # Only statements bound for the default (primary) engine are rerouted
+        if bind is not None or engine is not self._db.engines.get(None):
+            return engine
+        writing = self._flushing or isinstance(clause, UpdateBase)
+        if _is_tenant_table(mapper, clause):
+            shard = self._tenant_shard(writing)
+            if shard is not None:
+                return self._db.engines[shard]
+        if isinstance(clause, UpdateBase) and not self._use_primary:
+            self._use_primary = True
+            _mark_writer()
+        if self._use_primary or writing:
+            return engine
+        if not (has_app_context() and g.get("use_replica", False)):
+            return engine
+
+        if self._replica is None:
+            replicas = [e for key, e in self._db.engines.items() if key and key.startswith(REPLICA_BIND_PREFIX)]
+            if not replicas:
+                return engine
+            # Pin one replica per session so a request sees a consistent snapshot
+            self._replica = random.choice(replicas)
+        return self._replica
+
+    def flush(self, objects=None):
+        if self.new or self.dirty or self.deleted:
+            self._use_primary = True
+            _mark_writer()
+        super().flush(objects)
+
+    def commit(self):
+        if self._commits_deferred:
+            self.flush()  # Left for the caller of deferred_commit to commit
+            return
+        super().commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        self._after_commit = []
+        super().rollback()
+
+@contextmanager
+def deferred_commit(session):
+    """
+    Turns commit() into flush() inside the block, so the caller can add its own
+    changes and commit everything in one transaction. Accepts db.session.
+    """
+    session = session()  # The scoped session's RoutingSession for this request
+    session._commits_deferred += 1
+    try:
+        yield session
+    finally:
+        session._commits_deferred -= 1
+
+def after_commit(session, callback):
+    """
+    Runs callback once the changes made so far are committed: right away after a
+    plain commit(), or after the real commit inside deferred_commit. Dropped if the
+    session rolls back instead. For side effects outside the database, such as
+    cache invalidation. Accepts db.session.
+    """
+    session = session()
+    if session._commits_deferred:
+        session._after_commit.append(callback)
+    else:
+        callback()
+
+def replica_reads(view):
+    """
+    Marks a read-only route as safe to serve from a replica. Requests fall back to
+    the primary when the user wrote recently or sends "X-Consistency: strong".
+    Apply below @jwt_required() so the identity is available.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        strong = request.headers.get("X-Consistency", "").lower() == "strong"
+        g.use_replica = not strong and not _wrote_recently(_current_identity())
+        return view(*args, **kwargs)
+    return wrapper
+
+def init_read_your_writes(app):
+    """
+    Returns the read-your-writes deadline to the client after a write, as a cookie
+    and as a header that API clients not sending cookies can echo back
+    """
+    @app.after_request
+    def send_read_primary_marker(response):
+        deadline = g.get("read_primary_until")
+        if deadline is not None:
+            response.headers[READ_PRIMARY_HEADER] = f"{deadline:.3f}"
+            response.set_cookie(
+                READ_PRIMARY_COOKIE, f"{deadline:.3f}", max_age=app.config["REPLICA_STICKY_SECONDS"],
+                httponly=True, secure=request.is_secure, samesite="Lax",
+            )
+        return response
+
+# -------------------- Monitoring --------------------
+def pool_stats(db):
+    """ Returns connection pool statistics for every configured engine """
+    stats = {}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        entry = {"pool": type(pool).__name__, "status": pool.status()}
+        for metric in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, metric):
+                entry[metric] = getattr(pool, metric)()
+        stats[key or "primary"] = entry
+    return stats
@@ -0,0 +1,148 @@
+import hashlib
+import threading
+from datetime import timedelta
+from functools import wraps
+
+from cachetools import TTLCache
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from database import deferred_commit
+from models import db, IdempotencyRecord
+from tokens import utcnow
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 200
+
+# Completed responses as (fingerprint, status_code, body, mimetype), so hot retries skip the database
+_responses = TTLCache(maxsize=Config.IDEMPOTENCY_CACHE_SIZE, ttl=Config.IDEMPOTENCY_TTL_SECONDS)
+_responses_lock = threading.Lock()
+
+# -------------------- Helper Functions --------------------
+def _fingerprint():
+    """ Hashes what makes a request unique, so a reused key with a different payload is caught """
+    digest = hashlib.sha256()
+    digest.update(request.method.encode("utf-8"))
+    digest.update(request.path.encode("utf-8"))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+def _replay(status_code, body, mimetype):
+    response = Response(body, status=status_code, mimetype=mimetype)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+def _claim(key, fingerprint):
+    """
+    Claims the key for this request by inserting a placeholder record. Returns
+    None when claimed, or the existing record when another request holds it.
+    """
+    now = utcnow()
+    record = IdempotencyRecord.query.filter_by(key=key).first()
+    if record is not None:
+        abandoned = record.status_code is None and record.created_at < now - timedelta(seconds=Config.IDEMPOTENCY_LOCK_SECONDS)
+        if record.expires_at > now and not abandoned:
+            return record
+        db.session.delete(record)  # Expired or abandoned by a crashed worker
+        db.session.flush()
+
+    db.session.add(IdempotencyRecord(
+        key=key,
+        fingerprint=fingerprint,
+        created_at=now,
+        expires_at=now + timedelta(seconds=Config.IDEMPOTENCY_TTL_SECONDS),
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Lost the race to a concurrent request with the same key
+        db.session.rollback()
+        return IdempotencyRecord.query.filter_by(key=key).first()
+    return None
+
+# -------------------- Decorator --------------------
+def idempotent(view):
+    """
+    Answers retried requests that carry the same Idempotency-Key from the stored
+    response, without running the view again. Apply below @jwt_required();
+    keys are scoped per user.
+
+    The view's commit is deferred so its rows and the completed record commit in
+    one transaction, and a crash cannot leave rows behind a claim that a retry
+    would take over. Side effects the view registers with database.after_commit
+    run once that transaction has committed. When the tenant lives on a shard
+    (see sharding.py) the rows and the record are in different databases and
+    commit one after the other, without two-phase commit; a crash between the
+    two can still commit one without the other.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get(HEADER)
+        if not header:
+            return view(*args, **kwargs)
+        if len(header) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+        key = f"{get_jwt_identity()}:{header}"
+        fingerprint = _fingerprint()
+
+        with _responses_lock:
+            cached = _responses.get(key)
+        if cached is not None:
+            if cached[0] != fingerprint:
+                return jsonify({"error": f"{HEADER} was already used for a different request"}), 422
+            return _replay(*cached[1:])
+
+        record = _claim(key, fingerprint)
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                return jsonify({"error": f"{HEADER} was already used for a different request"}), 422
+            if record.status_code is None:
+                return jsonify({"error": "A request with this Idempotency-Key is still being processed"}), 409
+            with _responses_lock:
+                _responses[key] = (record.fingerprint, record.status_code, record.response_body, record.mimetype)
+            return _replay(record.status_code, record.response_body, record.mimetype)
+
+        try:
+            with deferred_commit(db.session):
+                response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            IdempotencyRecord.query.filter_by(key=key).delete()
+            db.session.commit()
+            raise
+
+        if response.status_code >= 400:
+            db.session.rollback()  # Error responses never mean to commit pending changes
+        record = IdempotencyRecord.query.filter_by(key=key).first()
+        if response.status_code >= 500:
+            # Server errors are not final; release the key so the client can retry
+            db.session.delete(record)
+        else:
+            record.status_code = response.status_code
+            record.response_body = response.get_data(as_text=True)
+            record.mimetype = response.mimetype
+        db.session.commit()  # The view's changes and the record together, then its after_commit callbacks
+        if response.status_code < 500:
+            with _responses_lock:
+                _responses[key] = (fingerprint, response.status_code, response.get_data(as_text=True), response.mimetype)
+        return response
+    return wrapper
+
+def purge_idempotency_records(batch_size):
+    """ Deletes expired idempotency records in batches. Returns the number deleted. """
+    deleted = 0
+    now = utcnow()
+    while True:
+        ids = db.session.execute(
+            db.select(IdempotencyRecord.id).where(IdempotencyRecord.expires_at < now).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return deleted
+        db.session.execute(
+            db.delete(IdempotencyRecord).where(IdempotencyRecord.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        deleted += len(ids)
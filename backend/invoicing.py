@@ -0,0 +1,118 @@
+from sqlalchemy import Integer, cast, func
+
+from models import db, Invoice, ArchivedInvoice, ItemType, ItemUnit
+from reports import revenue_delta, apply_revenue_deltas
+
+def parse_items(items):
+    """
+    Validates raw invoice line items from a request payload and returns them as
+    dicts ready for InvoiceItem. Raises ValueError with the API error message.
+    """
+    parsed = []
+    for item in items:
+        try:
+            quantity = float(item["quantity"])
+            rate = float(item["rate"])
+            discount = float(item.get("discount", 0.0))
+        except (KeyError, ValueError, TypeError) as e:
+            raise ValueError(f"Invalid numeric values in items: {item}, error: {str(e)}")
+
+        type_key = item.get("type")
+        if not type_key:
+            raise ValueError("Item type is required")
+        type_key = type_key.upper()  # ✅ Convert to match enum keys
+        if type_key not in ItemType.__members__:
+            raise ValueError(f"Invalid item type '{type_key}'")
+
+        unit_key = item.get("unit")
+        if not unit_key:
+            raise ValueError("Item unit is required")
+        unit_key = unit_key.upper()  # ✅ Convert to match enum keys
+        if unit_key not in ItemUnit.__members__:
+            raise ValueError(f"Invalid or missing unit '{unit_key}'")
+
+        parsed.append({
+            "item_type": ItemType[type_key],
+            "description": item.get("description"),
+            "quantity": quantity,
+            "unit": ItemUnit[unit_key],
+            "rate": rate,
+            "discount": discount,
+        })
+    return parsed
+
+def compute_totals(items, tax_rate):
+    """
+    Fills in gross_amount and net_amount on each parsed item and returns the
+    invoice totals (subtotal, total_discount, tax_amount, total_amount).
+    """
+    subtotal, total_discount = 0.0, 0.0
+
+    for item in items:
+        gross_amount = item["quantity"] * item["rate"]
+        item["gross_amount"] = gross_amount
+        item["net_amount"] = gross_amount * (1 - item["discount"] / 100)
+
+        subtotal += gross_amount
+        total_discount += gross_amount * (item["discount"] / 100)
+
+    discounted_price = subtotal - total_discount
+    tax_amount = (tax_rate / 100) * discounted_price
+    return {
+        "subtotal": subtotal,
+        "total_discount": total_discount,
+        "tax_amount": tax_amount,
+        "total_amount": discounted_price + tax_amount,
+    }
+
+def last_invoice_numbers(user_ids):
+    """
+    Returns {user_id: highest invoice number} for the given users, across hot and
+    archived invoices, with one GROUP BY query per table, so invoice numbers can
+    be allocated in bulk.
+    """
+    last_numbers = {}
+    for model in (Invoice, ArchivedInvoice):
+        rows = db.session.execute(
+            db.select(model.user_id, func.max(cast(model.invoice_number, Integer)))
+            .where(model.user_id.in_(user_ids))
+            .group_by(model.user_id)
+        ).all()
+        for user_id, last in rows:
+            last_numbers[user_id] = max(last_numbers.get(user_id, 0), last or 0)
+    return last_numbers
+
+def bulk_transition(user_id, invoice_ids, new_status, allowed_from, values):
+    """
+    Moves the user's invoices in `invoice_ids` whose status is in `allowed_from` to
+    `new_status` with one set-based UPDATE, applying the matching revenue deltas.
+    Returns ({invoice_id: previous status} for every owned invoice, set of updated ids).
+    The caller commits.
+    """
+    # Lock the rows so the statuses used for revenue deltas cannot change underneath us
+    rows = db.session.execute(
+        db.select(Invoice.id, Invoice.status, Invoice.user_id, Invoice.client_id,
+                  Invoice.currency, Invoice.issue_date, Invoice.total_amount)
+        .where(Invoice.id.in_(invoice_ids), Invoice.user_id == user_id)
+        .with_for_update()
+    ).all()
+    found = {row.id: row for row in rows}
+
+    eligible = [row.id for row in rows if row.status in allowed_from]
+    updated = set()
+    if eligible:
+        updated = set(db.session.execute(
+            db.update(Invoice)
+            .where(Invoice.id.in_(eligible), Invoice.user_id == user_id, Invoice.status.in_(allowed_from))
+            .values(status=new_status, **values)
+            .returning(Invoice.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all())
+
+    deltas = {}
+    for invoice_id in updated:
+        key, delta = revenue_delta(found[invoice_id], found[invoice_id].status, new_status)
+        deltas[key] = tuple(a + b for a, b in zip(deltas.get(key, (0.0, 0.0, 0.0)), delta))
+    apply_revenue_deltas(deltas)
+
+    return {invoice_id: row.status for invoice_id, row in found.items()}, updated
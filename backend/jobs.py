@@ -0,0 +1,106 @@
+import click
+from flask import Blueprint, current_app
+
+from tokens import purge_tokens
+from reminders import run_reminders
+from recurring import generate_recurring_invoices
+from reports import backfill_revenue
+from archive import archive_settled_invoices
+from idempotency import purge_idempotency_records
+from sessions import PrunedSqlAlchemySessionInterface
+from sharding import for_each_shard, move_tenant
+
+# Blueprint for periodic maintenance jobs, run from cron as "flask <command>"
+jobs_bp = Blueprint("jobs", __name__, cli_group=None)
+
+@jobs_bp.cli.command("purge-tokens")
+@click.option("--batch-size", type=int, default=None, help="Rows deleted per transaction.")
+def purge_tokens_command(batch_size):
+    """ Delete expired email verification and password reset tokens """
+    batch_size = batch_size or current_app.config["TOKEN_PURGE_BATCH_SIZE"]
+    deleted = purge_tokens(batch_size)
+    click.echo(f"Purged {deleted} expired tokens.")
+
+@jobs_bp.cli.command("send-reminders")
+@click.option("--dry-run", is_flag=True, help="Print the digests instead of sending them.")
+def send_reminders_command(dry_run):
+    """
+    Email payment reminder digests for invoices that became due soon or overdue
+    and were not reminded at that stage yet. To try it locally, point MAIL_SERVER/MAIL_PORT at a
+    debugging SMTP server such as "python -m aiosmtpd -n -l localhost:1025".
+    """
+    batches = for_each_shard(lambda shard: run_reminders(
+        batch_size=current_app.config["REMINDER_BATCH_SIZE"],
+        lead_days=current_app.config["REMINDER_LEAD_DAYS"],
+        dry_run=dry_run,
+    ))
+    messages = [message for batch in batches for message in batch]
+    if dry_run:
+        for message in messages:
+            click.echo(f"To: {', '.join(message.recipients)}\nSubject: {message.subject}\n\n{message.body}\n")
+    click.echo(f"{'Built' if dry_run else 'Sent'} {len(messages)} reminder digests.")
+
+@jobs_bp.cli.command("generate-recurring")
+@click.option("--batch-size", type=int, default=None, help="Templates processed per transaction.")
+def generate_recurring_command(batch_size):
+    """ Issue every recurring invoice that is due, across all users """
+    batch_size = batch_size or current_app.config["RECURRING_BATCH_SIZE"]
+    created = sum(for_each_shard(lambda shard: generate_recurring_invoices(batch_size)))
+    click.echo(f"Generated {created} recurring invoices.")
+
+@jobs_bp.cli.command("backfill-revenue")
+@click.option("--batch-size", type=int, default=1000, help="Invoices streamed per fetch.")
+def backfill_revenue_command(batch_size):
+    """ Rebuild the monthly revenue buckets from existing invoices """
+    written = sum(for_each_shard(lambda shard: backfill_revenue(batch_size)))
+    click.echo(f"Wrote {written} revenue buckets.")
+
+@jobs_bp.cli.command("archive-invoices")
+@click.option("--older-than-days", type=int, default=None, help="Minimum age past the due date.")
+@click.option("--batch-size", type=int, default=None, help="Invoices moved per transaction.")
+def archive_invoices_command(older_than_days, batch_size):
+    """ Move old paid and cancelled invoices into the archive tables """
+    archived = sum(for_each_shard(lambda shard: archive_settled_invoices(
+        older_than_days or current_app.config["ARCHIVE_AFTER_DAYS"],
+        batch_size or current_app.config["ARCHIVE_BATCH_SIZE"],
+    )))
+    click.echo(f"Archived {archived} invoices.")
+
+@jobs_bp.cli.command("purge-idempotency-keys")
+@click.option("--batch-size", type=int, default=1000, help="Rows deleted per transaction.")
+def purge_idempotency_keys_command(batch_size):
+    """ Delete stored responses whose Idempotency-Key has expired """
+    deleted = purge_idempotency_records(batch_size)
+    click.echo(f"Purged {deleted} expired idempotency records.")
+
+@jobs_bp.cli.command("prune-sessions")
+@click.option("--batch-size", type=int, default=None, help="Rows deleted per transaction.")
+def prune_sessions_command(batch_size):
+    """ Delete expired server-side sessions (SESSION_TYPE=sqlalchemy) """
+    interface = getattr(current_app.session_interface, "inner", None)
+    if not isinstance(interface, PrunedSqlAlchemySessionInterface):
+        click.echo(f"Nothing to prune for SESSION_TYPE={current_app.config['SESSION_TYPE']}.")
+        return
+    deleted = interface.prune_expired(batch_size or current_app.config["SESSION_PRUNE_BATCH_SIZE"])
+    click.echo(f"Pruned {deleted} expired sessions.")
+
+@jobs_bp.cli.command("move-tenant")
+@click.argument("username")
+@click.argument("shard")
+@click.option("--batch-size", type=int, default=None, help="Rows copied or deleted per statement.")
+@click.option("--grace-seconds", type=int, default=None, help="Wait before deleting the source rows.")
+def move_tenant_command(username, shard, batch_size, grace_seconds):
+    """
+    Move a user's clients, invoices and reports to another shard ("default" or
+    "shard_<n>") while the account stays online; its writes are refused with a
+    503 until the copy completes.
+    """
+    config = current_app.config
+    moved = move_tenant(
+        username,
+        shard,
+        batch_size or config["SHARD_MOVE_BATCH_SIZE"],
+        config["SHARD_MAP_CACHE_TTL_SECONDS"] if grace_seconds is None else grace_seconds,
+        settle_seconds=config["SHARD_MOVE_SETTLE_SECONDS"],
+    )
+    click.echo(f"Moved {moved} invoices of {username} to {shard}.")
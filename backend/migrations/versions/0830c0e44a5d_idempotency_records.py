@@ -0,0 +1,39 @@
+"""Idempotency records of POST /invoice and POST /client responses
+
+Revision ID: 0830c0e44a5d
+Revises: 82b7bd3d4089
+Create Date: 2026-10-19 14:44:26
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0830c0e44a5d'
+down_revision = '82b7bd3d4089'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all may have added it already, see migrations/README
+    if sa.inspect(op.get_bind()).has_table("idempotency_record"):
+        return
+    op.create_table(
+        "idempotency_record",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("key", sa.String(length=255), nullable=False, unique=True),
+        sa.Column("fingerprint", sa.String(length=64), nullable=False),
+        sa.Column("status_code", sa.Integer(), nullable=True),
+        sa.Column("response_body", sa.Text(), nullable=True),
+        sa.Column("mimetype", sa.String(length=100), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_idempotency_record_expires_at", "idempotency_record", ["expires_at"])
+
+
+def downgrade():
+    op.drop_table("idempotency_record")
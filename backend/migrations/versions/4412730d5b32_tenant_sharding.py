@@ -0,0 +1,105 @@
+"""Tenant shard directory and id counters; tenant tables lose their user foreign keys
+
+Revision ID: 4412730d5b32
+Revises: 0830c0e44a5d
+Create Date: 2026-10-19 14:53:10
+
+Tenant tables may live on a shard without a user table, so their foreign keys
+to user.id go; on SQLite that rebuilds each of them. Users without a
+tenant_shard row stay on the primary. The id_counter rows are set up by the app
+when it starts (sharding.reserve_id_range). Steps check the current schema
+first, see migrations/README.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4412730d5b32'
+down_revision = '0830c0e44a5d'
+branch_labels = None
+depends_on = None
+
+# Names the unnamed foreign keys SQLite reflects, so batch mode can drop them
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+TENANT_TABLES = ("client", "invoice", "invoice_archive", "recurring_invoice", "revenue_bucket")
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _is_sqlite():
+    return op.get_bind().dialect.name == "sqlite"
+
+
+def _batch(table):
+    """ batch_alter_table that rebuilds the table on SQLite, keeping AUTOINCREMENT if it has it """
+    kwargs = {"naming_convention": NAMING_CONVENTION}
+    if _is_sqlite():
+        sql = op.get_bind().execute(
+            sa.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"), {"table": table}
+        ).scalar()
+        kwargs["recreate"] = "always"
+        kwargs["table_kwargs"] = {"sqlite_autoincrement": "AUTOINCREMENT" in sql.upper()}
+    return op.batch_alter_table(table, **kwargs)
+
+
+def _drop_sqlite_search_triggers():
+    """ Drops the search triggers, which break rebuilds of the tables they reference """
+    if not _is_sqlite():
+        return
+    triggers = op.get_bind().execute(sa.text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%\\_search\\_a_' ESCAPE '\\'"
+    )).scalars().all()
+    for trigger in triggers:
+        op.execute(f"DROP TRIGGER {trigger}")
+
+
+def _user_foreign_key(table):
+    """ Name of the table's foreign key to user.id, as reflected or as batch mode names it; None once dropped """
+    for foreign_key in _inspector().get_foreign_keys(table):
+        if foreign_key["referred_table"] == "user":
+            return foreign_key["name"] or f"fk_{table}_user_id_user"
+    return None
+
+
+def upgrade():
+    inspector = _inspector()
+    if not inspector.has_table("tenant_shard"):
+        op.create_table(
+            "tenant_shard",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+            sa.Column("shard", sa.String(length=50), nullable=False),
+            sa.Column("moving", sa.Boolean(), nullable=False),
+            sa.Column("draining_from", sa.String(length=50), nullable=True),
+            sa.PrimaryKeyConstraint("user_id"),
+        )
+    elif "draining_from" not in {column["name"] for column in inspector.get_columns("tenant_shard")}:
+        op.add_column("tenant_shard", sa.Column("draining_from", sa.String(length=50), nullable=True))
+
+    if not inspector.has_table("id_counter"):
+        op.create_table(
+            "id_counter",
+            sa.Column("table_name", sa.String(length=50), nullable=False),
+            sa.Column("next_id", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("table_name"),
+        )
+
+    _drop_sqlite_search_triggers()
+    for table in TENANT_TABLES:
+        foreign_key = _user_foreign_key(table)
+        if foreign_key is not None:
+            with _batch(table) as batch_op:
+                batch_op.drop_constraint(foreign_key, type_="foreignkey")
+
+
+def downgrade():
+    _drop_sqlite_search_triggers()
+    for table in TENANT_TABLES:
+        with _batch(table) as batch_op:
+            batch_op.create_foreign_key(f"fk_{table}_user_id_user", "user", ["user_id"], ["id"])
+    op.drop_table("id_counter")
+    op.drop_table("tenant_shard")
@@ -0,0 +1,119 @@
+"""Archive tables for settled invoices, and invoice ids that are never reused
+
+Revision ID: 82b7bd3d4089
+Revises: ebe953f82c65
+Create Date: 2026-10-19 14:38:02
+
+Archived rows keep their ids, so on SQLite invoice and invoice_item are rebuilt
+with AUTOINCREMENT, which keeps ids of rows moved out from being handed out
+again. Steps check the current schema first, see migrations/README.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '82b7bd3d4089'
+down_revision = 'ebe953f82c65'
+branch_labels = None
+depends_on = None
+
+
+def _enum(name, *values):
+    """ Column type of an enum whose PostgreSQL type already exists """
+    return postgresql.ENUM(*values, name=name, create_type=False)
+
+
+CURRENCY = _enum("currency", "USD", "EUR", "GBP")
+INVOICE_STATUS = _enum("invoicestatus", "UNPAID", "PAID", "OVERDUE", "CANCELLED")
+PAYMENT_METHOD = _enum(
+    "paymentmethod", "CASH", "CHECK", "BANK_TRANSFER", "CREDIT_CARD", "DEBIT_CARD", "DIRECT_DEBIT",
+    "PAYPAL", "STRIPE", "BARTER_TRADE", "OTHER",
+)
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _sqlite_autoincrement(table):
+    sql = op.get_bind().execute(
+        sa.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"), {"table": table}
+    ).scalar()
+    return "AUTOINCREMENT" in sql.upper()
+
+
+def _drop_sqlite_search_triggers():
+    """ Drops the search triggers, which break rebuilds of the tables they reference """
+    triggers = op.get_bind().execute(sa.text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%\\_search\\_a_' ESCAPE '\\'"
+    )).scalars().all()
+    for trigger in triggers:
+        op.execute(f"DROP TRIGGER {trigger}")
+
+
+def upgrade():
+    if not _inspector().has_table("invoice_archive"):
+        op.create_table(
+            "invoice_archive",
+            sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+            sa.Column("client_id", sa.Integer(), sa.ForeignKey("client.id"), nullable=False),
+            sa.Column("invoice_number", sa.String(length=50), nullable=False),
+            sa.Column("issue_date", sa.Date(), nullable=False),
+            sa.Column("due_date", sa.Date(), nullable=False),
+            sa.Column("currency", CURRENCY, nullable=False),
+            sa.Column("tax_rate", sa.Float(), nullable=False),
+            sa.Column("subtotal", sa.Float(), nullable=False),
+            sa.Column("total_discount", sa.Float(), nullable=False),
+            sa.Column("tax_amount", sa.Float(), nullable=False),
+            sa.Column("total_amount", sa.Float(), nullable=False),
+            sa.Column("status", INVOICE_STATUS, nullable=False),
+            sa.Column("payment_method", PAYMENT_METHOD, nullable=False),
+            sa.Column("payment_details", sa.String(length=200), nullable=False),
+            sa.Column("payment_date", sa.Date(), nullable=True),
+            sa.Column("recurring_id", sa.Integer(), nullable=True),
+            sa.Column("recurring_period", sa.Date(), nullable=True),
+            sa.Column("reminder_stage", sa.Integer(), server_default="0", nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_invoice_archive_user_id", "invoice_archive", ["user_id"])
+    elif "reminder_stage" not in {column["name"] for column in _inspector().get_columns("invoice_archive")}:
+        # Created by an app from before reminder stages, which archived invoices copy
+        op.add_column("invoice_archive", sa.Column("reminder_stage", sa.Integer(), server_default="0", nullable=False))
+
+    if not _inspector().has_table("invoice_item_archive"):
+        op.create_table(
+            "invoice_item_archive",
+            sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column("invoice_id", sa.Integer(), sa.ForeignKey("invoice_archive.id"), nullable=False),
+            sa.Column("item_type", _enum("itemtype", "SERVICE", "PRODUCT"), nullable=False),
+            sa.Column("description", sa.String(length=200), nullable=False),
+            sa.Column("quantity", sa.Float(), nullable=False),
+            sa.Column("unit", _enum("itemunit", "HOUR", "ITEM"), nullable=False),
+            sa.Column("rate", sa.Float(), nullable=False),
+            sa.Column("discount", sa.Float(), nullable=False),
+            sa.Column("gross_amount", sa.Float(), nullable=False),
+            sa.Column("net_amount", sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_invoice_item_archive_invoice_id", "invoice_item_archive", ["invoice_id"])
+
+    if op.get_bind().dialect.name == "sqlite":
+        for table in ("invoice", "invoice_item"):
+            if not _sqlite_autoincrement(table):
+                _drop_sqlite_search_triggers()
+                with op.batch_alter_table(table, recreate="always", table_kwargs={"sqlite_autoincrement": True}):
+                    pass
+
+    if "ix_invoice_item_invoice_id" not in {index["name"] for index in _inspector().get_indexes("invoice_item")}:
+        op.create_index("ix_invoice_item_invoice_id", "invoice_item", ["invoice_id"])
+
+
+def downgrade():
+    # AUTOINCREMENT is kept: dropping it would let SQLite reuse ids of deleted rows
+    op.drop_index("ix_invoice_item_invoice_id", table_name="invoice_item")
+    op.drop_table("invoice_item_archive")
+    op.drop_table("invoice_archive")
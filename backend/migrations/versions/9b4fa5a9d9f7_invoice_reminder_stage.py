@@ -0,0 +1,61 @@
+"""Reminder stage per invoice and the indexes of the reminder and archive scans
+
+Revision ID: 9b4fa5a9d9f7
+Revises: c5d7c4eab03d
+Create Date: 2026-10-19 14:09:51
+
+Also drops job_state, which the first version of the reminders job kept its
+due-date watermark in. Steps check the current schema first, see
+migrations/README.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4fa5a9d9f7'
+down_revision = 'c5d7c4eab03d'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_invoice_status_due_date": ["status", "due_date"],
+    "ix_invoice_status_reminder_stage_due_date": ["status", "reminder_stage", "due_date"],
+}
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _drop_sqlite_search_triggers():
+    """ Drops the search triggers, which break rebuilds of the tables they reference """
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    triggers = op.get_bind().execute(sa.text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%\\_search\\_a_' ESCAPE '\\'"
+    )).scalars().all()
+    for trigger in triggers:
+        op.execute(f"DROP TRIGGER {trigger}")
+
+
+def upgrade():
+    if "reminder_stage" not in {column["name"] for column in _inspector().get_columns("invoice")}:
+        op.add_column("invoice", sa.Column("reminder_stage", sa.Integer(), server_default="0", nullable=False))
+
+    existing = {index["name"] for index in _inspector().get_indexes("invoice")}
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, "invoice", columns)
+
+    if _inspector().has_table("job_state"):
+        op.drop_table("job_state")
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name="invoice")
+    _drop_sqlite_search_triggers()
+    with op.batch_alter_table("invoice") as batch_op:
+        batch_op.drop_column("reminder_stage")
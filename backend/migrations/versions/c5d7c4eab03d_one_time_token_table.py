@@ -0,0 +1,96 @@
+"""One-time token table for email verification and password reset tokens
+
+Revision ID: c5d7c4eab03d
+Revises:
+Create Date: 2026-10-19 14:02:37
+
+Pending verification tokens move out of user.verification_token, hashed the
+way tokens.issue_token stores them. Steps check the current schema first, see
+migrations/README.
+
+"""
+from datetime import datetime, timedelta, timezone
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d7c4eab03d'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TOKEN_PURPOSES = ("EMAIL_VERIFICATION", "PASSWORD_RESET")
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _move_verification_tokens():
+    """ Copies pending verification tokens into one_time_token, hashed, with a fresh expiry """
+    user = sa.table("user", sa.column("id", sa.Integer), sa.column("verification_token", sa.String))
+    token = sa.table(
+        "one_time_token",
+        sa.column("user_id", sa.Integer),
+        sa.column("purpose", postgresql.ENUM(*TOKEN_PURPOSES, name="tokenpurpose", create_type=False)),
+        sa.column("token_hash", sa.String), sa.column("created_at", sa.DateTime), sa.column("expires_at", sa.DateTime),
+    )
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    expires_at = now + timedelta(hours=current_app.config["VERIFICATION_TOKEN_TTL_HOURS"])
+    rows = op.get_bind().execute(
+        sa.select(user.c.id, user.c.verification_token).where(user.c.verification_token.isnot(None))
+    ).all()
+    if rows:
+        op.bulk_insert(token, [
+            {
+                "user_id": user_id,
+                "purpose": "EMAIL_VERIFICATION",
+                "token_hash": hashlib.sha256(raw.encode("utf-8")).hexdigest(),
+                "created_at": now,
+                "expires_at": expires_at,
+            }
+            for user_id, raw in rows
+        ])
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        postgresql.ENUM(*TOKEN_PURPOSES, name="tokenpurpose").create(bind, checkfirst=True)
+
+    if not _inspector().has_table("one_time_token"):
+        op.create_table(
+            "one_time_token",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+            sa.Column(
+                "purpose", postgresql.ENUM(*TOKEN_PURPOSES, name="tokenpurpose", create_type=False), nullable=False
+            ),
+            sa.Column("token_hash", sa.String(length=64), nullable=False, unique=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            sa.Column("consumed_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_one_time_token_user_id", "one_time_token", ["user_id"])
+        op.create_index("ix_one_time_token_expires_at", "one_time_token", ["expires_at"])
+
+    user_columns = {column["name"] for column in _inspector().get_columns("user")}
+    if "verification_token" in user_columns:
+        _move_verification_tokens()
+        with op.batch_alter_table("user") as batch_op:
+            batch_op.drop_column("verification_token")
+
+
+def downgrade():
+    # The raw tokens cannot be recovered from their hashes; pending users request a new email
+    with op.batch_alter_table("user") as batch_op:
+        batch_op.add_column(sa.Column("verification_token", sa.String(length=100), nullable=True))
+    op.drop_table("one_time_token")
+    if op.get_bind().dialect.name == "postgresql":
+        postgresql.ENUM(name="tokenpurpose").drop(op.get_bind(), checkfirst=True)
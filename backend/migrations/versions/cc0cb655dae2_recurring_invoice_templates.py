@@ -0,0 +1,129 @@
+"""Recurring invoice templates and the template period of generated invoices
+
+Revision ID: cc0cb655dae2
+Revises: 9b4fa5a9d9f7
+Create Date: 2026-10-19 14:17:05
+
+unique_recurring_period keeps a template from generating two invoices for the
+same period. Adding it rebuilds the invoice table on SQLite. Steps check the
+current schema first, see migrations/README.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'cc0cb655dae2'
+down_revision = '9b4fa5a9d9f7'
+branch_labels = None
+depends_on = None
+
+# Names the unnamed foreign keys SQLite reflects, so batch mode can drop them
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+CADENCES = ("WEEKLY", "MONTHLY", "QUARTERLY", "YEARLY")
+
+
+def _enum(name, *values):
+    """ Column type of an enum whose PostgreSQL type already exists """
+    return postgresql.ENUM(*values, name=name, create_type=False)
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _is_sqlite():
+    return op.get_bind().dialect.name == "sqlite"
+
+
+def _batch(table):
+    """ batch_alter_table that rebuilds the table on SQLite, keeping AUTOINCREMENT if it has it """
+    kwargs = {"naming_convention": NAMING_CONVENTION}
+    if _is_sqlite():
+        sql = op.get_bind().execute(
+            sa.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"), {"table": table}
+        ).scalar()
+        kwargs["recreate"] = "always"
+        kwargs["table_kwargs"] = {"sqlite_autoincrement": "AUTOINCREMENT" in sql.upper()}
+    return op.batch_alter_table(table, **kwargs)
+
+
+def _drop_sqlite_search_triggers():
+    """ Drops the search triggers, which break rebuilds of the tables they reference """
+    if not _is_sqlite():
+        return
+    triggers = op.get_bind().execute(sa.text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%\\_search\\_a_' ESCAPE '\\'"
+    )).scalars().all()
+    for trigger in triggers:
+        op.execute(f"DROP TRIGGER {trigger}")
+
+
+def _recurring_foreign_key():
+    """ Name of invoice's foreign key to recurring_invoice, as reflected or as batch mode names it """
+    for foreign_key in _inspector().get_foreign_keys("invoice"):
+        if foreign_key["referred_table"] == "recurring_invoice":
+            return foreign_key["name"] or "fk_invoice_recurring_id_recurring_invoice"
+    return None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        postgresql.ENUM(*CADENCES, name="cadence").create(bind, checkfirst=True)
+
+    if not _inspector().has_table("recurring_invoice"):
+        op.create_table(
+            "recurring_invoice",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+            sa.Column("client_id", sa.Integer(), sa.ForeignKey("client.id"), nullable=False),
+            sa.Column("currency", _enum("currency", "USD", "EUR", "GBP"), nullable=False),
+            sa.Column("tax_rate", sa.Float(), nullable=False),
+            sa.Column("payment_method", _enum(
+                "paymentmethod", "CASH", "CHECK", "BANK_TRANSFER", "CREDIT_CARD", "DEBIT_CARD", "DIRECT_DEBIT",
+                "PAYPAL", "STRIPE", "BARTER_TRADE", "OTHER",
+            ), nullable=False),
+            sa.Column("payment_details", sa.String(length=200), nullable=False),
+            sa.Column("items", sa.JSON(), nullable=False),
+            sa.Column("cadence", _enum("cadence", *CADENCES), nullable=False),
+            sa.Column("due_days", sa.Integer(), nullable=False),
+            sa.Column("start_date", sa.Date(), nullable=False),
+            sa.Column("next_run_date", sa.Date(), nullable=False),
+            sa.Column("active", sa.Boolean(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_recurring_invoice_active_next_run", "recurring_invoice", ["active", "next_run_date"])
+
+    columns = {column["name"] for column in _inspector().get_columns("invoice")}
+    constraints = {constraint["name"] for constraint in _inspector().get_unique_constraints("invoice")}
+    if {"recurring_id", "recurring_period"} <= columns and "unique_recurring_period" in constraints:
+        return
+    _drop_sqlite_search_triggers()
+    with _batch("invoice") as batch_op:
+        if "recurring_id" not in columns:
+            batch_op.add_column(sa.Column("recurring_id", sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(
+                "fk_invoice_recurring_id_recurring_invoice", "recurring_invoice", ["recurring_id"], ["id"]
+            )
+        if "recurring_period" not in columns:
+            batch_op.add_column(sa.Column("recurring_period", sa.Date(), nullable=True))
+        if "unique_recurring_period" not in constraints:
+            batch_op.create_unique_constraint("unique_recurring_period", ["recurring_id", "recurring_period"])
+
+
+def downgrade():
+    _drop_sqlite_search_triggers()
+    foreign_key = _recurring_foreign_key()
+    with _batch("invoice") as batch_op:
+        batch_op.drop_constraint("unique_recurring_period", type_="unique")
+        if foreign_key is not None:
+            batch_op.drop_constraint(foreign_key, type_="foreignkey")
+        batch_op.drop_column("recurring_period")
+        batch_op.drop_column("recurring_id")
+    op.drop_table("recurring_invoice")
+    if op.get_bind().dialect.name == "postgresql":
+        postgresql.ENUM(name="cadence").drop(op.get_bind(), checkfirst=True)
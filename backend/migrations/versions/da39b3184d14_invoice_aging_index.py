@@ -0,0 +1,27 @@
+"""Per-user index over invoice status and due date for the aging report
+
+Revision ID: da39b3184d14
+Revises: cc0cb655dae2
+Create Date: 2026-10-19 14:21:40
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'da39b3184d14'
+down_revision = 'cc0cb655dae2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all may have added it already, see migrations/README
+    existing = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("invoice")}
+    if "ix_invoice_user_status_due_date" not in existing:
+        op.create_index("ix_invoice_user_status_due_date", "invoice", ["user_id", "status", "due_date"])
+
+
+def downgrade():
+    op.drop_index("ix_invoice_user_status_due_date", table_name="invoice")
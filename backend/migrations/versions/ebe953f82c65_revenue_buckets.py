@@ -0,0 +1,95 @@
+"""Monthly revenue buckets, backfilled from the existing invoices
+
+Revision ID: ebe953f82c65
+Revises: da39b3184d14
+Create Date: 2026-10-19 14:30:18
+
+The backfill only runs while revenue_bucket is empty, and aggregates the way
+the backfill-revenue job does. Steps check the current schema first, see
+migrations/README.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'ebe953f82c65'
+down_revision = 'da39b3184d14'
+branch_labels = None
+depends_on = None
+
+CURRENCY = postgresql.ENUM("USD", "EUR", "GBP", name="currency", create_type=False)
+INVOICE_STATUS = postgresql.ENUM("UNPAID", "PAID", "OVERDUE", "CANCELLED", name="invoicestatus", create_type=False)
+
+
+def _contribution(status, amount):
+    """ (issued, paid, outstanding) an invoice adds to its bucket, as in reports._contribution """
+    if status == "PAID":
+        return amount, amount, 0.0
+    if status in ("UNPAID", "OVERDUE"):
+        return amount, 0.0, amount
+    return 0.0, 0.0, 0.0  # Cancelled invoices are not revenue
+
+
+def _backfill_revenue_buckets():
+    bind = op.get_bind()
+    bucket = sa.table(
+        "revenue_bucket",
+        sa.column("user_id", sa.Integer), sa.column("period", sa.Date), sa.column("client_id", sa.Integer),
+        sa.column("currency", CURRENCY), sa.column("issued", sa.Float),
+        sa.column("paid", sa.Float), sa.column("outstanding", sa.Float),
+    )
+    if bind.execute(sa.select(sa.func.count()).select_from(bucket)).scalar():
+        return
+
+    # The archive tables come later in the series, but create_all may have added them already
+    tables = [table for table in ("invoice", "invoice_archive") if sa.inspect(bind).has_table(table)]
+    totals = {}
+    for table in tables:
+        invoice = sa.table(
+            table,
+            sa.column("user_id", sa.Integer), sa.column("client_id", sa.Integer),
+            sa.column("currency", CURRENCY), sa.column("issue_date", sa.Date),
+            sa.column("status", INVOICE_STATUS), sa.column("total_amount", sa.Float),
+        )
+        rows = bind.execute(sa.select(
+            invoice.c.user_id, invoice.c.client_id, invoice.c.currency,
+            invoice.c.issue_date, invoice.c.status, invoice.c.total_amount,
+        ))
+        for user_id, client_id, currency, issue_date, status, amount in rows:
+            key = (user_id, issue_date.replace(day=1), client_id, currency)
+            current = totals.get(key, (0.0, 0.0, 0.0))
+            totals[key] = tuple(t + c for t, c in zip(current, _contribution(status, amount)))
+
+    if totals:
+        op.bulk_insert(bucket, [
+            {
+                "user_id": user_id, "period": period, "client_id": client_id, "currency": currency,
+                "issued": issued, "paid": paid, "outstanding": outstanding,
+            }
+            for (user_id, period, client_id, currency), (issued, paid, outstanding) in totals.items()
+        ])
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table("revenue_bucket"):
+        op.create_table(
+            "revenue_bucket",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+            sa.Column("client_id", sa.Integer(), sa.ForeignKey("client.id"), nullable=False),
+            sa.Column("currency", CURRENCY, nullable=False),
+            sa.Column("period", sa.Date(), nullable=False),
+            sa.Column("issued", sa.Float(), nullable=False),
+            sa.Column("paid", sa.Float(), nullable=False),
+            sa.Column("outstanding", sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("user_id", "period", "client_id", "currency", name="unique_revenue_bucket"),
+        )
+    _backfill_revenue_buckets()
+
+
+def downgrade():
+    op.drop_table("revenue_bucket")
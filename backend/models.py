@@ -2,7 +2,12 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Enum as SQLAlchemyEnum
 from enum import Enum
 
-db = SQLAlchemy()
+from database import RoutingSession, USE_ID_COUNTER, next_tenant_id
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Id default of tenant tables whose ids are generated on the shard, see sharding.reserve_id_range
+TENANT_ID_DEFAULT = next_tenant_id if USE_ID_COUNTER else None
 
 # ----------------- Enumerations -----------------
 class InvoiceStatus(Enum):
@@ -37,6 +42,16 @@ class ItemUnit(Enum):
     HOUR = 'Hour'
     ITEM = 'Item'
 
+class Cadence(Enum):
+    WEEKLY = 'Weekly'
+    MONTHLY = 'Monthly'
+    QUARTERLY = 'Quarterly'
+    YEARLY = 'Yearly'
+
+class TokenPurpose(Enum):
+    EMAIL_VERIFICATION = 'Email Verification'
+    PASSWORD_RESET = 'Password Reset'
+
 # ----------------- Models -----------------
 
 class User(db.Model):
@@ -44,7 +59,6 @@ class User(db.Model):
     username = db.Column(db.String(50), unique=True, nullable=False)
     password = db.Column(db.String(100), nullable=True)  # OAuth users have no local password
     is_verified = db.Column(db.Boolean, default=False)
-    verification_token = db.Column(db.String(100), nullable=True)
     name = db.Column(db.String(100), nullable=False)
     business_name = db.Column(db.String(100))
     email = db.Column(db.String(100), unique=True, nullable=False)
@@ -53,12 +67,26 @@ class User(db.Model):
     tax_number = db.Column(db.String(50))
 
     # Relationships
-    clients = db.relationship('Client', backref='user', cascade='all, delete-orphan')
-    invoices = db.relationship('Invoice', back_populates='user', cascade='all, delete-orphan')
+    clients = db.relationship('Client', primaryjoin='User.id == foreign(Client.user_id)', backref='user', cascade='all, delete-orphan')
+    invoices = db.relationship('Invoice', primaryjoin='User.id == foreign(Invoice.user_id)', back_populates='user', cascade='all, delete-orphan')
+    tokens = db.relationship('OneTimeToken', back_populates='user', cascade='all, delete-orphan')
 
-class Client(db.Model):
+class OneTimeToken(db.Model):
+    __tablename__ = 'one_time_token'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Associate with User
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    purpose = db.Column(db.Enum(TokenPurpose), nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 hex digest, never the raw token
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    consumed_at = db.Column(db.DateTime)
+
+    # Relationships
+    user = db.relationship('User', back_populates='tokens')
+
+class Client(db.Model):
+    id = db.Column(db.Integer, primary_key=True, default=TENANT_ID_DEFAULT)
+    user_id = db.Column(db.Integer, nullable=False)  # Associate with User (no foreign key, users live in the directory)
     name = db.Column(db.String(100), nullable=False)
     business_name = db.Column(db.String(100))
     email = db.Column(db.String(100), nullable=False)
@@ -69,8 +97,8 @@ class Client(db.Model):
     invoices = db.relationship('Invoice', back_populates='client', cascade='all, delete-orphan')
 
 class Invoice(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    id = db.Column(db.Integer, primary_key=True, default=TENANT_ID_DEFAULT)
+    user_id = db.Column(db.Integer, nullable=False)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
     invoice_number = db.Column(db.String(50), nullable=False)
     issue_date = db.Column(db.Date, nullable=False)
@@ -85,20 +113,28 @@ class Invoice(db.Model):
     payment_method = db.Column(db.Enum(PaymentMethod), nullable=False)
     payment_details = db.Column(db.String(200), nullable=False)
     payment_date = db.Column(db.Date)
+    recurring_id = db.Column(db.Integer, db.ForeignKey('recurring_invoice.id'))  # Template that generated it
+    recurring_period = db.Column(db.Date)  # Run date of the template period it was generated for
+    reminder_stage = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Last reminder sent, see reminders.py
 
     __table_args__ = (
         db.UniqueConstraint('user_id', 'invoice_number', name='unique_user_invoice_number'),
+        db.UniqueConstraint('recurring_id', 'recurring_period', name='unique_recurring_period'),
+        db.Index('ix_invoice_status_due_date', 'status', 'due_date'),  # Archive scans across all users
+        db.Index('ix_invoice_status_reminder_stage_due_date', 'status', 'reminder_stage', 'due_date'),  # Pending reminders
+        db.Index('ix_invoice_user_status_due_date', 'user_id', 'status', 'due_date'),  # Per-user aging reports
+        {'sqlite_autoincrement': True},  # Never reuse ids of invoices moved to the archive
     )
 
     # Relationships
-    user = db.relationship('User', back_populates='invoices')
+    user = db.relationship('User', primaryjoin='foreign(Invoice.user_id) == User.id', back_populates='invoices')
     client = db.relationship('Client', back_populates='invoices')
     items = db.relationship('InvoiceItem', back_populates='invoice', cascade='all, delete-orphan')
 
 class InvoiceItem(db.Model):
     __tablename__ = 'invoice_item'
-    id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=False)
+    id = db.Column(db.Integer, primary_key=True, default=TENANT_ID_DEFAULT)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=False, index=True)
     item_type = db.Column(db.Enum(ItemType), nullable=False)
     description = db.Column(db.String(200), nullable=False)
     quantity = db.Column(db.Float, nullable=False)
@@ -108,5 +144,132 @@ class InvoiceItem(db.Model):
     gross_amount = db.Column(db.Float, nullable=False)
     net_amount = db.Column(db.Float, nullable=False)
 
+    __table_args__ = (
+        {'sqlite_autoincrement': True},  # Never reuse ids of items moved to the archive
+    )
+
     # Relationships
     invoice = db.relationship('Invoice', back_populates='items')
+
+class ArchivedInvoice(db.Model):
+    """ Settled invoice moved out of the hot invoice table; same columns and ids as Invoice """
+    __tablename__ = 'invoice_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    invoice_number = db.Column(db.String(50), nullable=False)
+    issue_date = db.Column(db.Date, nullable=False)
+    due_date = db.Column(db.Date, nullable=False)
+    currency = db.Column(SQLAlchemyEnum(Currency), nullable=False)
+    tax_rate = db.Column(db.Float, nullable=False)
+    subtotal = db.Column(db.Float, nullable=False)
+    total_discount = db.Column(db.Float, nullable=False)
+    tax_amount = db.Column(db.Float, nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.Enum(InvoiceStatus), nullable=False)
+    payment_method = db.Column(db.Enum(PaymentMethod), nullable=False)
+    payment_details = db.Column(db.String(200), nullable=False)
+    payment_date = db.Column(db.Date)
+    recurring_id = db.Column(db.Integer)
+    recurring_period = db.Column(db.Date)
+    reminder_stage = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Relationships
+    client = db.relationship('Client')
+    items = db.relationship('ArchivedInvoiceItem', back_populates='invoice')
+
+class ArchivedInvoiceItem(db.Model):
+    """ Line item of an archived invoice; same columns and ids as InvoiceItem """
+    __tablename__ = 'invoice_item_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice_archive.id'), nullable=False, index=True)
+    item_type = db.Column(db.Enum(ItemType), nullable=False)
+    description = db.Column(db.String(200), nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    unit = db.Column(db.Enum(ItemUnit), nullable=False)
+    rate = db.Column(db.Float, nullable=False)
+    discount = db.Column(db.Float, nullable=False)
+    gross_amount = db.Column(db.Float, nullable=False)
+    net_amount = db.Column(db.Float, nullable=False)
+
+    # Relationships
+    invoice = db.relationship('ArchivedInvoice', back_populates='items')
+
+class RecurringInvoice(db.Model):
+    """ Template for an invoice that is issued again on every cadence period """
+    __tablename__ = 'recurring_invoice'
+    id = db.Column(db.Integer, primary_key=True, default=TENANT_ID_DEFAULT)
+    user_id = db.Column(db.Integer, nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    currency = db.Column(SQLAlchemyEnum(Currency), nullable=False)
+    tax_rate = db.Column(db.Float, nullable=False)
+    payment_method = db.Column(db.Enum(PaymentMethod), nullable=False)
+    payment_details = db.Column(db.String(200), nullable=False)
+    items = db.Column(db.JSON, nullable=False)  # Line items as submitted to POST /invoice
+    cadence = db.Column(db.Enum(Cadence), nullable=False)
+    due_days = db.Column(db.Integer, nullable=False)  # Days from issue date to due date
+    start_date = db.Column(db.Date, nullable=False)
+    next_run_date = db.Column(db.Date, nullable=False)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+
+    __table_args__ = (
+        db.Index('ix_recurring_invoice_active_next_run', 'active', 'next_run_date'),
+    )
+
+    # Relationships
+    user = db.relationship('User', primaryjoin='foreign(RecurringInvoice.user_id) == User.id')
+    client = db.relationship('Client')
+
+class RevenueBucket(db.Model):
+    """
+    Monthly revenue aggregate per user, client and currency, keyed by the month the
+    invoices were issued. Maintained incrementally as invoices change status.
+    """
+    __tablename__ = 'revenue_bucket'
+    id = db.Column(db.Integer, primary_key=True, default=TENANT_ID_DEFAULT)
+    user_id = db.Column(db.Integer, nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    currency = db.Column(SQLAlchemyEnum(Currency), nullable=False)
+    period = db.Column(db.Date, nullable=False)  # First day of the month
+    issued = db.Column(db.Float, nullable=False, default=0.0)
+    paid = db.Column(db.Float, nullable=False, default=0.0)
+    outstanding = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', 'client_id', 'currency', name='unique_revenue_bucket'),
+    )
+
+class IdempotencyRecord(db.Model):
+    """ Stored response for a request sent with an Idempotency-Key header """
+    __tablename__ = 'idempotency_record'
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), unique=True, nullable=False)  # "<username>:<Idempotency-Key>"
+    fingerprint = db.Column(db.String(64), nullable=False)  # SHA-256 of method, path and body
+    status_code = db.Column(db.Integer)  # Null while the first request is still being processed
+    response_body = db.Column(db.Text)
+    mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class TenantShard(db.Model):
+    """ Shard map entry: the database holding a user's clients, invoices and reports """
+    __tablename__ = 'tenant_shard'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    shard = db.Column(db.String(50), nullable=False)  # "default" (the primary) or a "shard_<n>" bind
+    moving = db.Column(db.Boolean, nullable=False, default=False)  # Writes are refused while it is copied
+    draining_from = db.Column(db.String(50))  # Shard still holding the rows of a finished move, until deleted
+
+class IdCounter(db.Model):
+    """ Next id of a tenant table on a shard, where ids are not drawn from sequences """
+    __tablename__ = 'id_counter'
+    table_name = db.Column(db.String(50), primary_key=True)
+    next_id = db.Column(db.Integer, nullable=False)
+
+# Tables stored on every shard: tenant rows partitioned by user_id, and the shard's id
+# counters. They have no foreign keys to the user table, which only exists in the
+# directory on the primary.
+TENANT_MODELS = (
+    Client, Invoice, InvoiceItem, ArchivedInvoice, ArchivedInvoiceItem, RecurringInvoice, RevenueBucket, IdCounter,
+)
+for model in TENANT_MODELS:
+    model.__table__.info["sharded"] = True
@@ -0,0 +1,155 @@
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from cachetools import LRUCache
+from flask import current_app, jsonify, request
+
+# Bucket store selected by RATELIMIT_STORAGE_URL, set up by init_rate_limiting
+_store = None
+
+# Per-process outcome counters keyed by (route, outcome), exposed by rate_limit_stats
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+# -------------------- Bucket Stores --------------------
+class MemoryBucketStore:
+    """
+    Token buckets shared by every thread of the worker, bounded to max_keys
+    buckets. An evicted bucket simply starts full again. Local stand-in for
+    RedisBucketStore, which shares the buckets across workers and hosts.
+    """
+    name = "memory"
+
+    def __init__(self, max_keys):
+        self._buckets = LRUCache(maxsize=max_keys)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period):
+        """
+        Takes one token from the bucket holding `capacity` tokens that refills
+        over `period` seconds. Returns 0 when allowed, otherwise the seconds
+        until a token is available.
+        """
+        rate = capacity / period
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+        return (1 - tokens) / rate
+
+    def size(self):
+        return len(self._buckets)
+
+# Refill and take atomically on the Redis server, using its clock so workers agree
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local rate = capacity / period
+local tokens = math.min(capacity, (tonumber(state[1]) or capacity) + (now - (tonumber(state[2]) or now)) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(period))
+return tostring(wait)
+"""
+
+class RedisBucketStore:
+    """ Token buckets in Redis, shared by every worker; idle buckets expire once refilled """
+    name = "redis"
+
+    def __init__(self, url):
+        import redis  # Optional dependency, only needed for a networked store
+
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key, capacity, period):
+        return float(self._take(keys=[key], args=[capacity, period]))
+
+    def size(self):
+        return None
+
+# -------------------- Helper Functions --------------------
+def _bucket_key(route, scope, subject):
+    """ Fixed-length key, so arbitrary usernames cannot bloat the store """
+    digest = hashlib.sha256(subject.encode("utf-8")).hexdigest()[:32]
+    return f"ratelimit:{route}:{scope}:{digest}"
+
+def _count(route, outcome):
+    with _counters_lock:
+        _counters[(route, outcome)] += 1
+
+def _too_many_requests(wait):
+    response = jsonify({"message": "Too many requests. Please try again later."})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+    return response
+
+def rate_limit_stats():
+    """ Returns the outcome counters per route, plus the size of the bucket store """
+    with _counters_lock:
+        counters = dict(_counters)
+    routes = {}
+    for (route, outcome), count in counters.items():
+        routes.setdefault(route, {})[outcome] = count
+    return {"store": _store.name, "buckets": _store.size(), "routes": routes}
+
+# -------------------- Decorator --------------------
+def rate_limited(route, account_field=None):
+    """
+    Takes a token from the client IP's bucket, and from the account's bucket when
+    the JSON body names one in `account_field`, before the view runs. Answers
+    429 with Retry-After once either is empty. Limits are set per route in
+    RATELIMIT_LIMITS as {"ip": (capacity, period), "account": (capacity, period)}.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+            if not config["RATELIMIT_ENABLED"]:
+                return view(*args, **kwargs)
+
+            limits = config["RATELIMIT_LIMITS"][route]
+            subjects = [("ip", request.remote_addr or "unknown")]
+            if account_field and "account" in limits:
+                account = (request.get_json(silent=True) or {}).get(account_field)
+                if isinstance(account, str) and account.strip():
+                    subjects.append(("account", account.strip().lower()))
+
+            for scope, subject in subjects:
+                capacity, period = limits[scope]
+                wait = _store.take(_bucket_key(route, scope, subject), capacity, period)
+                if wait > 0:
+                    _count(route, f"rejected_{scope}")
+                    return _too_many_requests(wait)
+
+            _count(route, "allowed")
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def init_rate_limiting(app):
+    """ Sets up the bucket store named by RATELIMIT_STORAGE_URL ("memory://" or "redis://...") """
+    global _store
+    url = app.config["RATELIMIT_STORAGE_URL"]
+    if url.startswith("memory://"):
+        _store = MemoryBucketStore(app.config["RATELIMIT_MAX_KEYS"])
+    elif url.startswith(("redis://", "rediss://", "unix://")):
+        _store = RedisBucketStore(url)
+    else:
+        raise ValueError(f"Unsupported RATELIMIT_STORAGE_URL: {url}")
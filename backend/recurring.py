@@ -0,0 +1,123 @@
+import calendar
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from invoicing import parse_items, compute_totals, last_invoice_numbers
+from models import db, Cadence, Invoice, InvoiceItem, InvoiceStatus, RecurringInvoice
+from reports import apply_revenue_deltas
+from sharding import moving_user_ids
+
+CADENCE_MONTHS = {Cadence.MONTHLY: 1, Cadence.QUARTERLY: 3, Cadence.YEARLY: 12}
+
+BATCH_ATTEMPTS = 3  # Tries per batch when a concurrent request takes one of its invoice numbers
+
+def add_months(day, months, anchor_day):
+    """ Moves a date by whole months, clamping anchor_day to the month's length """
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+def next_period(template, period):
+    """ Returns the run date following `period` for the template's cadence """
+    if template.cadence == Cadence.WEEKLY:
+        return period + timedelta(weeks=1)
+    return add_months(period, CADENCE_MONTHS[template.cadence], template.start_date.day)
+
+def _generate_batch(templates, today):
+    """
+    Generates every due period for a batch of templates: allocates invoice numbers
+    per user in bulk, inserts invoices and items with executemany, applies one
+    revenue delta per bucket and advances each template. Periods that already have
+    an invoice are skipped, so rerunning after a crash does not duplicate anything.
+    """
+    existing = set(db.session.execute(
+        db.select(Invoice.recurring_id, Invoice.recurring_period)
+        .where(Invoice.recurring_id.in_([template.id for template in templates]))
+        .where(Invoice.recurring_period <= today)
+    ).all())
+    last_numbers = last_invoice_numbers({template.user_id for template in templates})
+
+    invoice_rows, item_rows, revenue = [], [], {}
+    for template in templates:
+        items = parse_items(template.items)
+        totals = compute_totals(items, template.tax_rate)
+
+        period = template.next_run_date
+        while period <= today:
+            if (template.id, period) not in existing:
+                last_numbers[template.user_id] = last_numbers.get(template.user_id, 0) + 1
+                invoice_rows.append({
+                    "invoice_number": str(last_numbers[template.user_id]),
+                    "user_id": template.user_id,
+                    "client_id": template.client_id,
+                    "issue_date": period,
+                    "due_date": period + timedelta(days=template.due_days),
+                    "currency": template.currency,
+                    "tax_rate": template.tax_rate,
+                    "status": InvoiceStatus.UNPAID,
+                    "payment_method": template.payment_method,
+                    "payment_details": template.payment_details,
+                    "payment_date": None,
+                    "recurring_id": template.id,
+                    "recurring_period": period,
+                    **totals,
+                })
+                item_rows.append(items)
+
+                key = (template.user_id, period.replace(day=1), template.client_id, template.currency)
+                issued, paid, outstanding = revenue.get(key, (0.0, 0.0, 0.0))
+                revenue[key] = (issued + totals["total_amount"], paid, outstanding + totals["total_amount"])
+            period = next_period(template, period)
+        template.next_run_date = period
+
+    if invoice_rows:
+        invoice_ids = db.session.execute(
+            insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True), invoice_rows
+        ).scalars().all()
+        db.session.execute(insert(InvoiceItem), [
+            {"invoice_id": invoice_id, **item}
+            for invoice_id, items in zip(invoice_ids, item_rows)
+            for item in items
+        ])
+        apply_revenue_deltas(revenue)
+
+    db.session.commit()
+    return len(invoice_rows)
+
+def generate_recurring_invoices(batch_size, today=None):
+    """
+    Issues all due recurring invoices across all users, committing once per batch
+    of templates. A batch whose invoice numbers collide with invoices created
+    concurrently is rolled back and generated again with fresh numbers; after
+    BATCH_ATTEMPTS it is skipped, its templates stay due for the next run, and
+    the remaining batches go on. Templates of tenants being moved also stay due.
+    Returns the number of invoices created.
+    """
+    today = today or date.today()
+    created = 0
+    last_id = 0
+    while True:
+        # Keyset pagination keeps each batch query on the (active, next_run_date) index
+        templates = RecurringInvoice.query.filter(
+            RecurringInvoice.active.is_(True),
+            RecurringInvoice.next_run_date <= today,
+            RecurringInvoice.id > last_id,
+            RecurringInvoice.user_id.not_in(moving_user_ids()),
+        ).order_by(RecurringInvoice.id).limit(batch_size).all()
+        if not templates:
+            return created
+        last_id = templates[-1].id
+        for attempt in range(BATCH_ATTEMPTS):
+            try:
+                created += _generate_batch(templates, today)
+                break
+            except IntegrityError:
+                db.session.rollback()  # Expires the templates, so the retry starts from the database
+        else:
+            current_app.logger.warning(
+                "Skipped recurring templates %s..%s after %s conflicting attempts",
+                templates[0].id, last_id, BATCH_ATTEMPTS,
+            )
@@ -0,0 +1,130 @@
+from datetime import date, timedelta
+from itertools import groupby
+
+from flask_mail import Mail, Message
+from sqlalchemy.orm import joinedload
+
+from models import db, Invoice, InvoiceStatus, User
+from sharding import moving_user_ids
+
+mail = Mail()
+
+# Values of Invoice.reminder_stage: the last reminder sent for the invoice
+STAGE_NONE = 0
+STAGE_DUE_SOON = 1
+STAGE_OVERDUE = 2
+
+OPEN_STATUSES = (InvoiceStatus.UNPAID, InvoiceStatus.OVERDUE)
+
+def _reminder_stage(today):
+    """ Stage an invoice should be at on `today`, as a SQL expression over its due date """
+    return db.case((Invoice.due_date < today, STAGE_OVERDUE), else_=STAGE_DUE_SOON)
+
+# -------------------- Selection --------------------
+def find_reminder_invoices(today, lead_days):
+    """
+    Loads, in one query over the (status, reminder_stage, due_date) index, every
+    open invoice whose reminder stage is behind where its due date puts it: due
+    within lead_days but not reminded yet, or overdue without an overdue reminder.
+    Invoices created already due soon or overdue are picked up on the next run,
+    and so are those of tenants being moved. Their users are loaded from the
+    directory with one more query, since they may live in another database.
+    """
+    horizon = today + timedelta(days=lead_days)
+    query = Invoice.query.options(joinedload(Invoice.client)).filter(
+        Invoice.status.in_(OPEN_STATUSES),
+        Invoice.user_id.not_in(moving_user_ids()),
+        db.or_(
+            db.and_(Invoice.reminder_stage < STAGE_DUE_SOON, Invoice.due_date <= horizon),
+            db.and_(Invoice.reminder_stage < STAGE_OVERDUE, Invoice.due_date < today),
+        ),
+    )
+
+    invoices = query.order_by(Invoice.user_id, Invoice.client_id, Invoice.due_date).all()
+    # Fills the identity map, so invoice.user resolves without further queries
+    User.query.filter(User.id.in_({invoice.user_id for invoice in invoices})).all()
+    return invoices
+
+# -------------------- Rendering --------------------
+def _invoice_line(invoice, today):
+    """ One digest line describing an invoice and how late it is """
+    if invoice.due_date < today:
+        when = f"overdue since {invoice.due_date.strftime('%Y-%m-%d')}"
+    else:
+        when = f"due {invoice.due_date.strftime('%Y-%m-%d')}"
+    return f"- Invoice #{invoice.invoice_number}: {invoice.total_amount:.2f} {invoice.currency.name}, {when}"
+
+def build_client_digest(user, client, invoices, today):
+    """ Digest sent to a client listing what they owe one user """
+    sender_name = user.business_name or user.name
+    lines = "\n".join(_invoice_line(invoice, today) for invoice in invoices)
+    return Message(
+        subject=f"Payment reminder from {sender_name}",
+        recipients=[client.email],
+        reply_to=user.email,
+        body=f"Dear {client.name},\n\nThis is a friendly reminder about the following invoices from "
+             f"{sender_name}:\n\n{lines}\n\nIf you have already paid, please disregard this message."
+    )
+
+def build_user_digest(user, invoices, today):
+    """ Digest sent to a user summarising reminders that went to their clients """
+    sections = []
+    for client, client_invoices in groupby(invoices, key=lambda invoice: invoice.client):
+        lines = "\n".join(_invoice_line(invoice, today) for invoice in client_invoices)
+        sections.append(f"{client.name}:\n{lines}")
+    return Message(
+        subject="Your FreelanceBill payment reminders",
+        recipients=[user.email],
+        body=f"Hello {user.name},\n\nWe sent payment reminders for the following invoices:\n\n"
+             + "\n\n".join(sections)
+    )
+
+def build_digests(invoices, today):
+    """
+    Groups invoices (ordered by user, then client) into one digest per client
+    and one summary per user.
+    """
+    messages = []
+    for user, user_invoices in groupby(invoices, key=lambda invoice: invoice.user):
+        user_invoices = list(user_invoices)
+        for client, client_invoices in groupby(user_invoices, key=lambda invoice: invoice.client):
+            messages.append(build_client_digest(user, client, list(client_invoices), today))
+        messages.append(build_user_digest(user, user_invoices, today))
+    return messages
+
+# -------------------- Sending --------------------
+def send_in_batches(messages, batch_size):
+    """ Sends messages reusing one SMTP connection per batch of batch_size """
+    for start in range(0, len(messages), batch_size):
+        with mail.connect() as connection:
+            for message in messages[start:start + batch_size]:
+                connection.send(message)
+
+def mark_reminded(invoice_ids, today, batch_size):
+    """ Records the stage each invoice was just reminded at, one UPDATE per batch of ids """
+    invoice_ids = list(invoice_ids)
+    for start in range(0, len(invoice_ids), batch_size):
+        db.session.execute(
+            db.update(Invoice)
+            .where(Invoice.id.in_(invoice_ids[start:start + batch_size]))
+            .values(reminder_stage=_reminder_stage(today))
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+def run_reminders(batch_size, lead_days, today=None, dry_run=False):
+    """
+    Selects invoices whose reminder stage is behind, sends the digests and moves
+    the invoices to their new stage. Returns the digests built.
+    """
+    today = today or date.today()
+    invoices = find_reminder_invoices(today, lead_days)
+    messages = build_digests(invoices, today)
+    if dry_run:
+        return messages
+
+    send_in_batches(messages, batch_size)
+
+    # Only record the stages once everything was sent, so a failed run is retried
+    mark_reminded([invoice.id for invoice in invoices], today, batch_size)
+    return messages
@@ -0,0 +1,255 @@
+import threading
+from datetime import timedelta
+
+from cachetools import TTLCache
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+
+from config import Config
+from models import db, ArchivedInvoice, Client, Invoice, InvoiceStatus, RevenueBucket
+from sharding import moving_user_ids
+
+AGING_BUCKETS = ["0-30", "31-60", "61-90", "90+"]
+
+# Per-user report cache of (report date, report), keyed by JWT identity so a hit needs no database access
+_aging_cache = TTLCache(maxsize=Config.REPORT_CACHE_MAX_USERS, ttl=Config.REPORT_CACHE_TTL_SECONDS)
+_aging_cache_lock = threading.Lock()
+
+# -------------------- Aging Report --------------------
+def _aging_rows(user_id, today):
+    """
+    Sums open invoices per client, currency and age bucket in a single GROUP BY,
+    served by the (user_id, status, due_date) index.
+    """
+    bucket = case(
+        (Invoice.due_date >= today - timedelta(days=30), AGING_BUCKETS[0]),
+        (Invoice.due_date >= today - timedelta(days=60), AGING_BUCKETS[1]),
+        (Invoice.due_date >= today - timedelta(days=90), AGING_BUCKETS[2]),
+        else_=AGING_BUCKETS[3],
+    ).label("bucket")
+
+    return db.session.execute(
+        db.select(
+            Invoice.client_id,
+            Client.name,
+            Invoice.currency,
+            bucket,
+            func.sum(Invoice.total_amount),
+            func.count(Invoice.id),
+        )
+        .join(Client, Client.id == Invoice.client_id)
+        .where(Invoice.user_id == user_id)
+        .where(Invoice.status.in_([InvoiceStatus.UNPAID, InvoiceStatus.OVERDUE]))
+        .group_by(Invoice.client_id, Client.name, Invoice.currency, bucket)
+    ).all()
+
+def build_aging_report(user_id, today):
+    """ Shapes the grouped rows into per-client lines and per-currency totals """
+    clients, totals = {}, {}
+    for client_id, client_name, currency, bucket, amount, count in _aging_rows(user_id, today):
+        line = clients.setdefault((client_id, currency.name), {
+            "client_id": client_id,
+            "client": client_name,
+            "currency": currency.name,
+            **{name: 0.0 for name in AGING_BUCKETS},
+            "total": 0.0,
+            "invoice_count": 0,
+        })
+        line[bucket] += amount
+        line["total"] += amount
+        line["invoice_count"] += count
+
+        currency_totals = totals.setdefault(currency.name, {**{name: 0.0 for name in AGING_BUCKETS}, "total": 0.0})
+        currency_totals[bucket] += amount
+        currency_totals["total"] += amount
+
+    return {
+        "as_of": today.strftime("%Y-%m-%d"),
+        "buckets": AGING_BUCKETS,
+        "clients": sorted(clients.values(), key=lambda line: (line["client"], line["currency"])),
+        "totals": totals,
+    }
+
+def get_aging_report(identity, today, load_user_id):
+    """ Returns the cached report for the user, building it on a miss """
+    with _aging_cache_lock:
+        cached = _aging_cache.get(identity)
+    if cached is not None and cached[0] == today:
+        return cached[1]
+
+    report = build_aging_report(load_user_id(), today)
+    with _aging_cache_lock:
+        _aging_cache[identity] = (today, report)
+    return report
+
+def invalidate_reports(identity):
+    """ Drops cached reports for the user after their invoices changed """
+    with _aging_cache_lock:
+        _aging_cache.pop(identity, None)
+
+# -------------------- Revenue Buckets --------------------
+def _contribution(status, amount):
+    """ (issued, paid, outstanding) an invoice in the given status adds to its bucket """
+    if status == InvoiceStatus.PAID:
+        return amount, amount, 0.0
+    if status in (InvoiceStatus.UNPAID, InvoiceStatus.OVERDUE):
+        return amount, 0.0, amount
+    return 0.0, 0.0, 0.0  # Cancelled invoices are not revenue
+
+def revenue_delta(invoice, old_status, new_status):
+    """
+    Returns the bucket key and (issued, paid, outstanding) change for an invoice
+    moving from old_status (None for a new invoice) to new_status.
+    """
+    old = _contribution(old_status, invoice.total_amount) if old_status else (0.0, 0.0, 0.0)
+    new = _contribution(new_status, invoice.total_amount)
+    key = (invoice.user_id, invoice.issue_date.replace(day=1), invoice.client_id, invoice.currency)
+    return key, tuple(n - o for n, o in zip(new, old))
+
+def _is_bucket_conflict(error):
+    """ Checks whether an IntegrityError is a violation of unique_revenue_bucket """
+    diag = getattr(error.orig, "diag", None)  # psycopg2 names the violated constraint
+    if diag is not None and diag.constraint_name:
+        return diag.constraint_name == "unique_revenue_bucket"
+    # SQLite lists the constraint's columns instead
+    message = str(error.orig)
+    return "unique_revenue_bucket" in message or "revenue_bucket.user_id, revenue_bucket.period" in message
+
+def apply_revenue_deltas(deltas):
+    """
+    Adds {(user_id, period, client_id, currency): (issued, paid, outstanding)} to the
+    revenue buckets with in-place UPDATEs, inserting missing buckets. Runs in the
+    caller's transaction.
+    """
+    for (user_id, period, client_id, currency), (issued, paid, outstanding) in deltas.items():
+        if not (issued or paid or outstanding):
+            continue
+        key = db.and_(
+            RevenueBucket.user_id == user_id,
+            RevenueBucket.period == period,
+            RevenueBucket.client_id == client_id,
+            RevenueBucket.currency == currency,
+        )
+        update = db.update(RevenueBucket).where(key).values(
+            issued=RevenueBucket.issued + issued,
+            paid=RevenueBucket.paid + paid,
+            outstanding=RevenueBucket.outstanding + outstanding,
+        ).execution_options(synchronize_session=False)
+
+        if db.session.execute(update).rowcount:
+            continue
+        try:
+            # A concurrent request may create the same bucket; fall back to the UPDATE then
+            with db.session.begin_nested():
+                db.session.execute(db.insert(RevenueBucket).values(
+                    user_id=user_id, period=period, client_id=client_id, currency=currency,
+                    issued=issued, paid=paid, outstanding=outstanding,
+                ))
+        except IntegrityError as error:
+            # Anything else, or a bucket that still cannot be updated, would lose the delta
+            if not _is_bucket_conflict(error) or not db.session.execute(update).rowcount:
+                raise
+
+def record_revenue_change(invoice, old_status, new_status):
+    """ Applies one invoice's status change to its revenue bucket """
+    key, delta = revenue_delta(invoice, old_status, new_status)
+    apply_revenue_deltas({key: delta})
+
+def backfill_revenue(batch_size):
+    """
+    Rebuilds every revenue bucket from the invoice and archive tables, streaming
+    invoices in batches and aggregating in memory, so archived history keeps
+    counting. Buckets of tenants being moved are left as they are. Returns the
+    number of buckets written.
+
+    Revenue writes wait for the rebuild to commit, so none is lost between reading
+    the invoices and rewriting the buckets: the buckets are deleted first, which on
+    SQLite takes the database's write lock, and on PostgreSQL the table is locked.
+    """
+    moving = moving_user_ids()
+    bind = db.session.get_bind(mapper=RevenueBucket.__mapper__)
+    if bind.dialect.name == "postgresql":
+        db.session.execute(
+            db.text("LOCK TABLE revenue_bucket IN EXCLUSIVE MODE"), bind_arguments={"bind": bind}
+        )
+    db.session.execute(db.delete(RevenueBucket).where(RevenueBucket.user_id.not_in(moving)))
+
+    buckets = {}
+    for model in (Invoice, ArchivedInvoice):
+        rows = db.session.execute(
+            db.select(
+                model.user_id, model.client_id, model.currency,
+                model.issue_date, model.status, model.total_amount,
+            ).where(model.user_id.not_in(moving)).execution_options(yield_per=batch_size)
+        )
+        for user_id, client_id, currency, issue_date, status, amount in rows:
+            key = (user_id, issue_date.replace(day=1), client_id, currency)
+            totals = buckets.get(key, (0.0, 0.0, 0.0))
+            buckets[key] = tuple(t + c for t, c in zip(totals, _contribution(status, amount)))
+
+    if buckets:
+        db.session.execute(db.insert(RevenueBucket), [
+            {
+                "user_id": user_id, "period": period, "client_id": client_id, "currency": currency,
+                "issued": issued, "paid": paid, "outstanding": outstanding,
+            }
+            for (user_id, period, client_id, currency), (issued, paid, outstanding) in buckets.items()
+        ])
+    db.session.commit()
+    return len(buckets)
+
+# -------------------- Revenue Report --------------------
+GRANULARITY_MONTHS = {"month": 1, "quarter": 3, "year": 12}
+
+def _period_start(period, granularity):
+    """ Rolls a month bucket up to the start of its month, quarter or year """
+    months = GRANULARITY_MONTHS[granularity]
+    return period.replace(month=(period.month - 1) // months * months + 1)
+
+def _period_label(start, granularity):
+    if granularity == "year":
+        return str(start.year)
+    if granularity == "quarter":
+        return f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+    return start.strftime("%Y-%m")
+
+def build_revenue_report(user_id, granularity, start, end):
+    """
+    Reads the month buckets between start and end (inclusive) and rolls them up
+    into periods of the requested granularity, per currency and per client.
+    """
+    rows = db.session.execute(
+        db.select(RevenueBucket, Client.name)
+        .join(Client, Client.id == RevenueBucket.client_id)
+        .where(RevenueBucket.user_id == user_id)
+        .where(RevenueBucket.period >= start.replace(day=1), RevenueBucket.period <= end)
+        .order_by(RevenueBucket.period)
+    ).all()
+
+    periods = {}
+    for bucket, client_name in rows:
+        period_start = _period_start(bucket.period, granularity)
+        line = periods.setdefault((period_start, bucket.currency.name), {
+            "period": _period_label(period_start, granularity),
+            "currency": bucket.currency.name,
+            "issued": 0.0, "paid": 0.0, "outstanding": 0.0,
+            "clients": {},
+        })
+        client = line["clients"].setdefault(bucket.client_id, {
+            "client_id": bucket.client_id, "client": client_name,
+            "issued": 0.0, "paid": 0.0, "outstanding": 0.0,
+        })
+        for target in (line, client):
+            target["issued"] += bucket.issued
+            target["paid"] += bucket.paid
+            target["outstanding"] += bucket.outstanding
+
+    return {
+        "granularity": granularity,
+        "from": start.strftime("%Y-%m-%d"),
+        "to": end.strftime("%Y-%m-%d"),
+        "periods": [
+            {**line, "clients": list(line["clients"].values())}
+            for _, line in sorted(periods.items(), key=lambda entry: entry[0])
+        ],
+    }
@@ -1,16 +1,24 @@
 from flask import Blueprint, request, jsonify, redirect, current_app as app
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from flask_bcrypt import Bcrypt
-import secrets
 import google.auth.transport.requests
 import google.oauth2.id_token
 
-from models import db, User, Client, Invoice, InvoiceItem, PaymentMethod, InvoiceStatus, Currency, ItemType, ItemUnit
+from models import db, User, Client, Invoice, InvoiceItem, PaymentMethod, InvoiceStatus, Currency, TokenPurpose, RecurringInvoice, Cadence, ArchivedInvoice
 from flask_mail import Message, Mail
 from config import Config
+from database import after_commit, replica_reads, pool_stats
+import search as text_search
+import autocomplete
+from tokens import issue_token, find_token, consume_token
+from idempotency import idempotent
+from ratelimit import rate_limited, rate_limit_stats
+from sharding import TenantMovingError, current_user_id, place_tenant
+from invoicing import parse_items, compute_totals, bulk_transition, last_invoice_numbers
+from reports import get_aging_report, invalidate_reports, record_revenue_change, build_revenue_report, GRANULARITY_MONTHS
 from datetime import datetime
 
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy import func
 
 bcrypt = Bcrypt()
@@ -50,8 +58,89 @@ def send_password_recovery_email(email: str, token: str):
 
     mail.send(msg)
 
+def mark_overdue(invoices):
+    """
+    Moves unpaid invoices past their due date to Overdue and commits. Skipped while
+    the tenant is being moved to another shard, where writes are refused, so reads
+    keep working; the statuses catch up on a later read.
+    """
+    today = datetime.today().date()
+    for invoice in invoices:
+        if invoice.due_date < today and invoice.status == InvoiceStatus.UNPAID:
+            invoice.status = InvoiceStatus.OVERDUE
+    try:
+        db.session.commit()
+    except TenantMovingError:
+        db.session.rollback()
+
+def client_to_dict(client):
+    """
+    Serializes a client record for API responses.
+    """
+    return {
+        "id": client.id,
+        "name": client.name,
+        "business_name": client.business_name,
+        "email": client.email,
+        "phone": client.phone,
+        "address": client.address,
+        "tax_number": client.tax_number  # Include tax_number
+    }
+
+def invoice_to_dict(invoice, expand_client=False):
+    """
+    Serializes an invoice (hot or archived) and its line items for API responses.
+    """
+    invoice_data = {
+        "id": invoice.id,
+        "user_id": invoice.user_id,
+        "client_id": invoice.client_id,
+        "invoice_number": invoice.invoice_number,
+        "client": invoice.client.name if invoice.client else "Unknown",
+        "issue_date": invoice.issue_date.strftime("%Y-%m-%d"),
+        "due_date": invoice.due_date.strftime("%Y-%m-%d"),
+        "currency": invoice.currency.name,
+        "tax_rate": invoice.tax_rate,
+        "subtotal": invoice.subtotal,
+        "total_discount": invoice.total_discount,
+        "tax_amount": invoice.tax_amount,
+        "total_amount": invoice.total_amount,
+        "status": invoice.status.value,  # Convert enum to string
+        "payment_method": invoice.payment_method.value,  # Convert enum to string
+        "payment_details": invoice.payment_details,
+        "payment_date": invoice.payment_date.strftime("%Y-%m-%d") if invoice.payment_date else None,
+        "archived": isinstance(invoice, ArchivedInvoice),
+        "items": [{
+            "id": item.id,
+            "type": item.item_type.value,  # Convert enum to string
+            "description": item.description,
+            "quantity": item.quantity,
+            "unit": item.unit.value,  # Convert enum to string
+            "rate": item.rate,
+            "discount": item.discount,
+            "gross_amount": item.gross_amount,
+            "net_amount": item.net_amount
+        } for item in invoice.items]
+    }
+    if expand_client:
+        invoice_data["client_details"] = client_to_dict(invoice.client) if invoice.client else None
+    return invoice_data
+
+def wants_archived():
+    """
+    Checks whether the request asked to include archived invoices (?include_archived=true).
+    """
+    return request.args.get("include_archived", "").lower() == "true"
+
+def wants_client_expanded():
+    """
+    Checks whether the request asked for embedded client records (?expand=client).
+    """
+    return "client" in request.args.get("expand", "").split(",")
+
 # -------------------- Authentication Routes --------------------
 @routes_bp.route("/register", methods=["POST"])
+@rate_limited("register", account_field="username")
 def register():
     """
     Registers a new user. Generates a verification token and sends an email
@@ -74,15 +163,11 @@ def register():
     # Hash password
     hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
 
-    # Generate a token for verification
-    verification_token = secrets.token_urlsafe(32)
-
     # Create the new user with is_verified=False
     new_user = User(
         username=username,
         password=hashed_password,
         is_verified=False,
-        verification_token=verification_token,
         name=name,
         business_name=business_name,
         email=email,
@@ -91,6 +176,10 @@ def register():
         tax_number=tax_number
     )
     db.session.add(new_user)
+    place_tenant(new_user)  # Also ensures user ID is available for the token
+
+    # Generate a token for verification
+    verification_token = issue_token(new_user, TokenPurpose.EMAIL_VERIFICATION)
     db.session.commit()
 
     # Send a verification email
@@ -102,15 +191,14 @@ def register():
 @routes_bp.route("/verify/<token>", methods=["GET"])
 def verify_email(token):
     """
-    Verifies the user's email address if the token matches.
+    Verifies the user's email address if the token matches and has not expired.
     """
-    user = User.query.filter_by(verification_token=token).first()
-    if not user:
+    token_row = find_token(token, TokenPurpose.EMAIL_VERIFICATION)
+    if not token_row or not consume_token(token_row):
         return jsonify({"message": "Invalid verification token."}), 400
 
     # Mark the user as verified
-    user.is_verified = True
-    user.verification_token = None
+    token_row.user.is_verified = True
     db.session.commit()
 
     # Redirect to the frontend verification success page
@@ -118,6 +206,7 @@ def verify_email(token):
 
 
 @routes_bp.route("/login", methods=["POST"])
+@rate_limited("login", account_field="username")
 def login():
     """
     Traditional login route. Checks if user is verified before issuing JWT.
@@ -168,6 +257,7 @@ def change_password():
 
 
 @routes_bp.route("/recover-password", methods=["POST"])
+@rate_limited("recover-password", account_field="email")
 def recover_password():
     """
     Sends a password recovery email with a link to the React reset password page.
@@ -180,8 +270,7 @@ def recover_password():
         return jsonify({"message": "User not found"}), 404
 
     # Generate a password reset token
-    recovery_token = secrets.token_urlsafe(32)
-    user.verification_token = recovery_token
+    recovery_token = issue_token(user, TokenPurpose.PASSWORD_RESET)
     db.session.commit()
 
     # Send the password recovery email with a React frontend link
@@ -192,10 +281,10 @@ def recover_password():
 @routes_bp.route("/reset-password/<token>", methods=["POST"])
 def reset_password(token):
     """
-    Resets the user's password if the token matches.
+    Resets the user's password if the token matches and has not expired.
     """
-    user = User.query.filter_by(verification_token=token).first()
-    if not user:
+    token_row = find_token(token, TokenPurpose.PASSWORD_RESET)
+    if not token_row:
         return jsonify({"message": "Invalid or expired token."}), 400
 
     data = request.get_json()
@@ -208,15 +297,19 @@ def reset_password(token):
     if new_password != confirm_password:
         return jsonify({"message": "Passwords do not match."}), 400
 
+    # Consume the token so it cannot be replayed
+    if not consume_token(token_row):
+        return jsonify({"message": "Invalid or expired token."}), 400
+
     # Hash the new password and update the user
     hashed_new_password = bcrypt.generate_password_hash(new_password).decode("utf-8")
-    user.password = hashed_new_password
-    user.verification_token = None  # Clear the token after successful reset
+    token_row.user.password = hashed_new_password
     db.session.commit()
 
     return jsonify({"message": "Password reset successful. You can now log in."}), 200
 
 @routes_bp.route("/login/google", methods=["POST"])
+@rate_limited("login-google")
 def login_google():
     """
     Client-side Google OAuth login flow.
@@ -252,6 +345,7 @@ def login_google():
                 email=email,
             )
             db.session.add(user)
+            place_tenant(user)
             db.session.commit()
 
         # Generate our own JWT for the user
@@ -283,8 +377,7 @@ def update_email():
 
     user.username = new_email
     user.is_verified = False  # Mark the new email as unverified
-    verification_token = secrets.token_urlsafe(32)
-    user.verification_token = verification_token
+    verification_token = issue_token(user, TokenPurpose.EMAIL_VERIFICATION)
     db.session.commit()
 
     # Send a verification email to the new email address
@@ -295,6 +388,7 @@ def update_email():
 # -------------------- Profile Routes --------------------
 @routes_bp.route("/user", methods=["GET"])
 @jwt_required()
+@replica_reads
 def get_user_details():
     """ Fetch details of the authenticated user """
     current_user = get_jwt_identity()
@@ -346,23 +440,29 @@ def update_user_details():
 # -------------------- Client Routes --------------------
 @routes_bp.route("/clients", methods=["GET"])
 @jwt_required()
+@replica_reads
 def get_clients():
-    """ Fetch all clients for the authenticated user """
-    current_user = get_jwt_identity()
-    clients = Client.query.join(User).filter(User.username == current_user).all()
+    """
+    Fetch all clients for the authenticated user, or only those listed in
+    ?ids=1,2,3 (resolved with a single IN query)
+    """
+    query = Client.query.filter(Client.user_id == current_user_id())
 
-    return jsonify([{
-        "id": client.id,
-        "name": client.name,
-        "business_name": client.business_name,
-        "email": client.email,
-        "phone": client.phone,
-        "address": client.address,
-        "tax_number": client.tax_number  # Include tax_number
-    } for client in clients]), 200
+    ids_param = request.args.get("ids")
+    if ids_param is not None:
+        try:
+            ids = {int(client_id) for client_id in ids_param.split(",") if client_id.strip()}
+        except ValueError:
+            return jsonify({"error": "Invalid client ids"}), 400
+        query = query.filter(Client.id.in_(ids))
+
+    clients = query.all()
+
+    return jsonify([client_to_dict(client) for client in clients]), 200
 
 @routes_bp.route("/client", methods=["POST"])
 @jwt_required()
+@idempotent
 def create_client():
     """ Create a new client """
     data = request.get_json()
@@ -387,29 +487,39 @@ def create_client():
     )
     db.session.add(client)
     db.session.commit()
+    after_commit(db.session, lambda: autocomplete.client_changed(current_user, client))
     return jsonify({"message": "Client created successfully", "client_id": client.id}), 201
 
+@routes_bp.route("/clients/autocomplete", methods=["GET"])
+@jwt_required()
+@replica_reads
+def autocomplete_clients():
+    """ Suggest clients whose name or business name starts with the query """
+    prefix = request.args.get("q", "")
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), 50)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    current_user = get_jwt_identity()
+    suggestions = autocomplete.lookup(
+        current_user,
+        prefix,
+        limit,
+        lambda: Client.query.filter(Client.user_id == current_user_id()).all()
+    )
+    return jsonify(suggestions), 200
+
 # Get a single client by ID
 @routes_bp.route("/clients/<int:client_id>", methods=["GET"])
 @jwt_required()
 def get_client(client_id):
     """ Fetch a single client by ID """
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-
-    client = Client.query.filter_by(id=client_id, user_id=user.id).first()
+    client = Client.query.filter(Client.user_id == current_user_id(), Client.id == client_id).first()
     if not client:
         return jsonify({"message": "Client not found"}), 404
 
-    return jsonify({
-        "id": client.id,
-        "name": client.name,
-        "business_name": client.business_name,
-        "email": client.email,
-        "phone": client.phone,
-        "address": client.address,
-        "tax_number": client.tax_number  # Include tax_number
-    }), 200
+    return jsonify(client_to_dict(client)), 200
 
 @routes_bp.route("/clients/<int:client_id>", methods=["PUT"])
 @jwt_required()
@@ -436,72 +546,42 @@ def update_client(client_id):
     client.tax_number = data.get("tax_number", client.tax_number)  # Include tax_number
 
     db.session.commit()
+    autocomplete.client_changed(current_user, client)
 
     return jsonify({"message": "Client updated successfully"}), 200
 
 # -------------------- Invoice Routes --------------------
 @routes_bp.route("/invoices", methods=["GET"])
 @jwt_required()
+@replica_reads
 def get_invoices():
-    """ Fetch all invoices for the authenticated user with optimized joins """
-    current_user = get_jwt_identity()
-
+    """
+    Fetch all invoices for the authenticated user with optimized joins.
+    Archived invoices are included with ?include_archived=true.
+    """
     # Query all invoices for the user joined with the client
-    invoices = Invoice.query.join(User).filter(User.username == current_user).options(joinedload(Invoice.client)).all()
+    invoices = Invoice.query.filter(Invoice.user_id == current_user_id()).options(joinedload(Invoice.client)).all()
 
     # Check due date and update status in the database if overdue
-    today = datetime.today().date()
-    for inv in invoices:
-        # Determine if the invoice is overdue
-        if inv.due_date < today and inv.status == InvoiceStatus.UNPAID:
-            inv.status = InvoiceStatus.OVERDUE
-        
-    # Commit the changes to the database
-    db.session.commit()
+    mark_overdue(invoices)
 
-    # Query again to ensure changes are reflected
-    invoices = Invoice.query.join(User).filter(User.username == current_user).options(joinedload(Invoice.client)).all()
-    
-    # Build the response data
-    invoices_data = []
-    for inv in invoices:
-        items = InvoiceItem.query.filter_by(invoice_id=inv.id).all()
-        invoices_data.append({
-            "id": inv.id,
-            "user_id": inv.user_id,
-            "client_id": inv.client_id,
-            "invoice_number": inv.invoice_number,
-            "client": inv.client.name if inv.client else "Unknown",
-            "issue_date": inv.issue_date.strftime("%Y-%m-%d"),
-            "due_date": inv.due_date.strftime("%Y-%m-%d"),
-            "currency": inv.currency.name,
-            "tax_rate": inv.tax_rate,
-            "subtotal": inv.subtotal,
-            "total_discount": inv.total_discount,
-            "tax_amount": inv.tax_amount,
-            "total_amount": inv.total_amount,
-            "status": inv.status.value,  # Convert enum to string
-            "payment_method": inv.payment_method.value,  # Convert enum to string
-            "payment_details": inv.payment_details,
-            "payment_date": inv.payment_date.strftime("%Y-%m-%d") if inv.payment_date else None,
-            "items": [{
-                "id": item.id,
-                "type": item.item_type.value,
-                "description": item.description,
-                "quantity": item.quantity,
-                "unit": item.unit.value,
-                "rate": item.rate,
-                "discount": item.discount,
-                "gross_amount": item.gross_amount,
-                "net_amount": item.net_amount
-            } for item in items]
-        })
+    # Query again to ensure changes are reflected, loading items in one extra query
+    invoices = Invoice.query.filter(Invoice.user_id == current_user_id()).options(
+        joinedload(Invoice.client), selectinload(Invoice.items)
+    ).all()
+    invoices_data = [invoice_to_dict(inv, wants_client_expanded()) for inv in invoices]
+
+    # Settled invoices moved to the archive are only read on request
+    if wants_archived():
+        archived = ArchivedInvoice.query.filter(ArchivedInvoice.user_id == current_user_id()).options(joinedload(ArchivedInvoice.client), selectinload(ArchivedInvoice.items)).all()
+        invoices_data.extend(invoice_to_dict(inv, wants_client_expanded()) for inv in archived)
 
     return jsonify(invoices_data), 200
 
 
 @routes_bp.route("/invoice", methods=["POST"])
 @jwt_required()
+@idempotent
 def create_invoice():
     """Create a new invoice with line items"""
     data = request.get_json()
@@ -556,43 +636,25 @@ def create_invoice():
         return jsonify({"error": "User not found"}), 404
 
     # Validate client
-    client = Client.query.get(data["client_id"])
+    client = Client.query.filter_by(id=data["client_id"], user_id=user.id).first()
     if not client:
         return jsonify({"error": "Client not found"}), 404
 
-    # Generate sequential invoice number for the user
-    last_invoice = Invoice.query.filter_by(user_id=user.id).order_by(Invoice.id.desc()).first()
-    if last_invoice:
-        last_invoice_number = int(last_invoice.invoice_number)
-        invoice_number = str(last_invoice_number + 1)
-    else:
-        invoice_number = "1"
-
-    # Compute invoice totals
-    items = data.get("items", [])
-    subtotal, total_discount = 0.0, 0.0
+    # Generate sequential invoice number for the user, counting archived invoices too
+    last_invoice_number = last_invoice_numbers([user.id]).get(user.id, 0)
+    invoice_number = str(last_invoice_number + 1)
 
-    for item in items:
-        try:
-            quantity = float(item["quantity"])
-            rate = float(item["rate"])
-            discount = float(item.get("discount", 0.0))
-        except (ValueError, TypeError) as e:
-            return jsonify({"error": f"Invalid numeric values in items: {item}, error: {str(e)}"}), 400
-
-        gross_amount = quantity * rate
-        net_amount = gross_amount * (1 - discount / 100)
-
-        subtotal += gross_amount
-        total_discount += gross_amount * (discount / 100)
+    # Validate line items and compute invoice totals
+    try:
+        items = parse_items(data.get("items", []))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    discounted_price = subtotal - total_discount
     try:
         tax_rate = float(data.get("tax_rate", 0.0))
     except (ValueError, TypeError):
         return jsonify({"error": "Invalid tax rate"}), 400
-    tax_amount = (tax_rate / 100) * discounted_price
-    total_amount = discounted_price + tax_amount
+    totals = compute_totals(items, tax_rate)
 
     # Create Invoice
     invoice = Invoice(
@@ -603,125 +665,71 @@ def create_invoice():
         due_date=due_date,
         currency=currency,
         tax_rate=tax_rate,
-        subtotal=subtotal,
-        total_discount=total_discount,
-        tax_amount=tax_amount,
-        total_amount=total_amount,
         status=status_enum,
         payment_method=payment_method,
         payment_details=payment_details,
         payment_date=None,
+        **totals,
     )
     db.session.add(invoice)
     db.session.flush()  # Ensure invoice ID is available before adding items
 
     # Create Invoice Items
     for item in items:
-        type_key = item.get("type")
-        if not type_key:
-            return jsonify({"error": "Item type is required"}), 400
-        type_key = type_key.upper()  # ✅ Convert to match enum keys
-        if type_key not in ItemType.__members__:
-            return jsonify({"error": f"Invalid item type '{type_key}'"}), 400
-        type_enum = ItemType[type_key]
-
-        unit_key = item.get("unit")
-        if not unit_key:
-            return jsonify({"error": "Item unit is required"}), 400
-        unit_key = unit_key.upper()  # ✅ Convert to match enum keys
-        if unit_key not in ItemUnit.__members__:
-            return jsonify({"error": f"Invalid or missing unit '{unit_key}'"}), 400
-        unit_enum = ItemUnit[unit_key]
-
-        gross_amount = float(item["quantity"]) * float(item["rate"])
-        net_amount = gross_amount * (1 - float(item.get("discount", 0.0)) / 100)
-
-        invoice_item = InvoiceItem(
-            invoice_id=invoice.id,
-            item_type=type_enum,
-            description=item["description"],
-            quantity=float(item["quantity"]),
-            unit=unit_enum,
-            rate=float(item["rate"]),
-            discount=float(item.get("discount", 0.0)),
-            gross_amount=gross_amount,
-            net_amount=net_amount,
-        )
-        db.session.add(invoice_item)
+        db.session.add(InvoiceItem(invoice_id=invoice.id, **item))
+
+    record_revenue_change(invoice, None, status_enum)
 
     db.session.commit()
+    after_commit(db.session, lambda: invalidate_reports(current_user))
     return jsonify({"message": "Invoice created successfully", "invoice_id": invoice.id}), 201
 
 @routes_bp.route("/invoice/<int:invoice_id>", methods=["GET"])
 @jwt_required()
+@replica_reads
 def get_invoice(invoice_id):
-    """ Fetch a single invoice by ID """
-    invoice = Invoice.query.get(invoice_id)
+    """ Fetch a single invoice by ID, falling back to the archive with ?include_archived=true """
+    invoice = Invoice.query.filter(Invoice.user_id == current_user_id(), Invoice.id == invoice_id).first()
+    if not invoice and wants_archived():
+        archived = ArchivedInvoice.query.filter(
+            ArchivedInvoice.user_id == current_user_id(), ArchivedInvoice.id == invoice_id
+        ).first()
+        if archived:
+            return jsonify(invoice_to_dict(archived, wants_client_expanded())), 200
     if not invoice:
         return jsonify({"message": "Invoice not found"}), 404
     
     # Check due date and update status if overdue
-    today = datetime.today().date()
-    if invoice.due_date < today and invoice.status == InvoiceStatus.UNPAID:
-        invoice.status = InvoiceStatus.OVERDUE
-        db.session.commit()
+    mark_overdue([invoice])
     
     # Query again to ensure changes are reflected
-    invoice = Invoice.query.get(invoice_id)
+    invoice = Invoice.query.filter(Invoice.user_id == current_user_id(), Invoice.id == invoice_id).first()
 
-    # Query the items for the invoice
-    items = InvoiceItem.query.filter_by(invoice_id=invoice_id).all()
-
-    return jsonify({
-        "id": invoice.id,
-        "user_id": invoice.user_id,
-        "client_id": invoice.client_id,
-        "invoice_number": invoice.invoice_number,
-        "client": invoice.client.name if invoice.client else "Unknown",
-        "issue_date": invoice.issue_date.strftime("%Y-%m-%d"),
-        "due_date": invoice.due_date.strftime("%Y-%m-%d"),
-        "currency": invoice.currency.name,
-        "tax_rate": invoice.tax_rate,
-        "status": invoice.status.value,  # Convert enum to string
-        "payment_method": invoice.payment_method.value,  # Convert enum to string
-        "payment_details": invoice.payment_details,
-        "payment_date": invoice.payment_date.strftime("%Y-%m-%d") if invoice.payment_date else None,
-        "subtotal": invoice.subtotal,
-        "total_discount": invoice.total_discount,
-        "tax_amount": invoice.tax_amount,
-        "total_amount": invoice.total_amount,
-        "items": [{
-            "id": item.id,
-            "type": item.item_type.value,  # Convert enum to string
-            "description": item.description,
-            "quantity": item.quantity,
-            "unit": item.unit.value,  # Convert enum to string
-            "rate": item.rate,
-            "discount": item.discount,
-            "gross_amount": item.gross_amount,
-            "net_amount": item.net_amount
-        } for item in items]
-    }), 200
+    return jsonify(invoice_to_dict(invoice, wants_client_expanded())), 200
 
 # -------------------- Payment Tracking --------------------
 @routes_bp.route("/invoice/<int:invoice_id>/mark-paid", methods=["PUT"])
 @jwt_required()
 def mark_invoice_paid(invoice_id):
     """ Mark an invoice as paid """
-    invoice = Invoice.query.get(invoice_id)
+    current_user = get_jwt_identity()
+    invoice = Invoice.query.filter(Invoice.user_id == current_user_id(), Invoice.id == invoice_id).first()
     if not invoice:
         return jsonify({"message": "Invoice not found"}), 404
     # invoice.status = "Paid"
+    record_revenue_change(invoice, invoice.status, InvoiceStatus.PAID)
     invoice.status = InvoiceStatus.PAID
     invoice.payment_date = datetime.now().date()
     db.session.commit()
+    invalidate_reports(current_user)
     return jsonify({"message": "Invoice marked as paid"}), 200
 
 @routes_bp.route("/invoice/<int:invoice_id>/cancel", methods=["PUT"])
 @jwt_required()
 def cancel_invoice(invoice_id):
     """ Cancel an invoice """
-    invoice = Invoice.query.get(invoice_id)
+    current_user = get_jwt_identity()
+    invoice = Invoice.query.filter(Invoice.user_id == current_user_id(), Invoice.id == invoice_id).first()
     if not invoice:
         return jsonify({"message": "Invoice not found"}), 404
 
@@ -731,8 +739,348 @@ def cancel_invoice(invoice_id):
 
     # Allow cancellation only if the invoice is unpaid or overdue
     if invoice.status in [InvoiceStatus.UNPAID, InvoiceStatus.OVERDUE]:
+        record_revenue_change(invoice, invoice.status, InvoiceStatus.CANCELLED)
         invoice.status = InvoiceStatus.CANCELLED
         db.session.commit()
+        invalidate_reports(current_user)
         return jsonify({"message": "Invoice cancelled"}), 200
 
-    return jsonify({"message": "Invoice cannot be cancelled"}), 400
\ No newline at end of file
+    return jsonify({"message": "Invoice cannot be cancelled"}), 400
+
+def parse_invoice_ids(data):
+    """
+    Reads the "invoice_ids" list from a bulk request payload. Raises ValueError
+    with the API error message.
+    """
+    invoice_ids = (data or {}).get("invoice_ids")
+    if not isinstance(invoice_ids, list) or not invoice_ids:
+        raise ValueError("invoice_ids must be a non-empty list")
+    if len(invoice_ids) > Config.BULK_MAX_INVOICES:
+        raise ValueError(f"At most {Config.BULK_MAX_INVOICES} invoices can be updated at once")
+    if not all(isinstance(invoice_id, int) and not isinstance(invoice_id, bool) for invoice_id in invoice_ids):
+        raise ValueError("invoice_ids must contain integer ids")
+    return list(dict.fromkeys(invoice_ids))  # Drop duplicates, keep order
+
+@routes_bp.route("/invoices/mark-paid", methods=["PUT"])
+@jwt_required()
+def mark_invoices_paid():
+    """ Mark many invoices as paid with one set-based update """
+    try:
+        invoice_ids = parse_invoice_ids(request.get_json())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    current_user = get_jwt_identity()
+    user = User.query.filter_by(username=current_user).first()
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+
+    found, updated = bulk_transition(
+        user.id,
+        invoice_ids,
+        InvoiceStatus.PAID,
+        allowed_from=[InvoiceStatus.UNPAID, InvoiceStatus.OVERDUE, InvoiceStatus.CANCELLED],
+        values={"payment_date": datetime.now().date()},
+    )
+    db.session.commit()
+    invalidate_reports(current_user)
+
+    results = []
+    for invoice_id in invoice_ids:
+        if invoice_id in updated:
+            outcome = "paid"
+        elif invoice_id not in found:
+            outcome = "not_found"
+        elif found[invoice_id] == InvoiceStatus.PAID:
+            outcome = "already_paid"
+        else:
+            outcome = "conflict"  # Status changed concurrently
+        results.append({"invoice_id": invoice_id, "outcome": outcome})
+
+    return jsonify({"updated": len(updated), "results": results}), 200
+
+@routes_bp.route("/invoices/cancel", methods=["PUT"])
+@jwt_required()
+def cancel_invoices():
+    """ Cancel many invoices with one set-based update; paid invoices are left untouched """
+    try:
+        invoice_ids = parse_invoice_ids(request.get_json())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    current_user = get_jwt_identity()
+    user = User.query.filter_by(username=current_user).first()
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+
+    found, updated = bulk_transition(
+        user.id,
+        invoice_ids,
+        InvoiceStatus.CANCELLED,
+        allowed_from=[InvoiceStatus.UNPAID, InvoiceStatus.OVERDUE],
+        values={},
+    )
+    db.session.commit()
+    invalidate_reports(current_user)
+
+    results = []
+    for invoice_id in invoice_ids:
+        if invoice_id in updated:
+            outcome = "cancelled"
+        elif invoice_id not in found:
+            outcome = "not_found"
+        elif found[invoice_id] == InvoiceStatus.PAID:
+            outcome = "cannot_cancel_paid"
+        elif found[invoice_id] == InvoiceStatus.CANCELLED:
+            outcome = "already_cancelled"
+        else:
+            outcome = "conflict"  # Status changed concurrently
+        results.append({"invoice_id": invoice_id, "outcome": outcome})
+
+    return jsonify({"updated": len(updated), "results": results}), 200
+
+# -------------------- Recurring Invoices --------------------
+def recurring_invoice_to_dict(template):
+    """
+    Serializes a recurring invoice template for API responses.
+    """
+    return {
+        "id": template.id,
+        "client_id": template.client_id,
+        "client": template.client.name if template.client else "Unknown",
+        "currency": template.currency.name,
+        "tax_rate": template.tax_rate,
+        "payment_method": template.payment_method.value,
+        "payment_details": template.payment_details,
+        "items": template.items,
+        "cadence": template.cadence.value,
+        "due_days": template.due_days,
+        "start_date": template.start_date.strftime("%Y-%m-%d"),
+        "next_run_date": template.next_run_date.strftime("%Y-%m-%d"),
+        "active": template.active
+    }
+
+@routes_bp.route("/recurring-invoices", methods=["GET"])
+@jwt_required()
+@replica_reads
+def get_recurring_invoices():
+    """ Fetch all recurring invoice templates for the authenticated user """
+    templates = RecurringInvoice.query.filter(RecurringInvoice.user_id == current_user_id()).options(
+        joinedload(RecurringInvoice.client)
+    ).all()
+
+    return jsonify([recurring_invoice_to_dict(template) for template in templates]), 200
+
+@routes_bp.route("/recurring-invoice", methods=["POST"])
+@jwt_required()
+def create_recurring_invoice():
+    """Create a recurring invoice template, issued by the `flask generate-recurring` job"""
+    data = request.get_json()
+
+    required_fields = [
+        "client_id",
+        "start_date",
+        "cadence",
+        "currency",
+        "tax_rate",
+        "payment_method",
+        "payment_details",
+        "items",
+    ]
+    if any(field not in data for field in required_fields):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    try:
+        start_date = datetime.strptime(data["start_date"], "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({"error": "Invalid date format (expected YYYY-MM-DD)"}), 400
+
+    try:
+        due_days = int(data.get("due_days", 30))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid due days"}), 400
+    if due_days < 0:
+        return jsonify({"error": "Due days cannot be negative"}), 400
+
+    cadence_key = data["cadence"].upper()
+    if cadence_key not in Cadence.__members__:
+        return jsonify({"error": f"Invalid cadence '{data['cadence']}'"}), 400
+
+    currency_code = data["currency"].upper()
+    currency = getattr(Currency, currency_code, None)
+    if not currency:
+        return jsonify({"error": f"Invalid currency '{currency_code}'"}), 400
+
+    payment_method_value = data["payment_method"].strip().replace(" ", "_").upper()
+    payment_method = PaymentMethod.__members__.get(payment_method_value, None)
+    if not payment_method:
+        return jsonify({"error": f"Invalid payment method '{data['payment_method']}'"}), 400
+
+    payment_details = data.get("payment_details")
+    if not payment_details:
+        return jsonify({"error": "Payment details are required"}), 400
+
+    try:
+        tax_rate = float(data["tax_rate"])
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid tax rate"}), 400
+
+    # Validate items now so the scheduler never meets an invalid template
+    try:
+        parse_items(data["items"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    current_user = get_jwt_identity()
+    user = User.query.filter_by(username=current_user).first()
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    client = Client.query.filter_by(id=data["client_id"], user_id=user.id).first()
+    if not client:
+        return jsonify({"error": "Client not found"}), 404
+
+    template = RecurringInvoice(
+        user_id=user.id,
+        client_id=client.id,
+        currency=currency,
+        tax_rate=tax_rate,
+        payment_method=payment_method,
+        payment_details=payment_details,
+        items=data["items"],
+        cadence=Cadence[cadence_key],
+        due_days=due_days,
+        start_date=start_date,
+        next_run_date=start_date,
+        active=True,
+    )
+    db.session.add(template)
+    db.session.commit()
+    return jsonify({"message": "Recurring invoice created successfully", "recurring_invoice_id": template.id}), 201
+
+@routes_bp.route("/recurring-invoice/<int:template_id>/cancel", methods=["PUT"])
+@jwt_required()
+def cancel_recurring_invoice(template_id):
+    """ Stop issuing a recurring invoice """
+    template = RecurringInvoice.query.filter(
+        RecurringInvoice.user_id == current_user_id(), RecurringInvoice.id == template_id
+    ).first()
+    if not template:
+        return jsonify({"message": "Recurring invoice not found"}), 404
+
+    template.active = False
+    db.session.commit()
+    return jsonify({"message": "Recurring invoice cancelled"}), 200
+
+# -------------------- Reports --------------------
+@routes_bp.route("/reports/aging", methods=["GET"])
+@jwt_required()
+@replica_reads
+def get_aging():
+    """ Accounts-receivable aging of open invoices by client and currency """
+    current_user = get_jwt_identity()
+    today = datetime.today().date()
+
+    def load_user_id():
+        user = User.query.filter_by(username=current_user).first()
+        return user.id if user else None
+
+    return jsonify(get_aging_report(current_user, today, load_user_id)), 200
+
+def parse_period(value, default):
+    """
+    Parses a YYYY-MM or YYYY-MM-DD query parameter, returning `default` if absent.
+    """
+    if not value:
+        return default
+    for fmt in ("%Y-%m-%d", "%Y-%m"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+@routes_bp.route("/reports/revenue", methods=["GET"])
+@jwt_required()
+@replica_reads
+def get_revenue():
+    """ Issued, paid and outstanding totals per period, currency and client """
+    granularity = request.args.get("granularity", "month")
+    if granularity not in GRANULARITY_MONTHS:
+        return jsonify({"error": f"Invalid granularity '{granularity}'"}), 400
+
+    today = datetime.today().date()
+    default_start = today.replace(year=today.year - 1, day=1)  # Same month last year
+    try:
+        start = parse_period(request.args.get("from"), default_start)
+        end = parse_period(request.args.get("to"), today)
+    except ValueError:
+        return jsonify({"error": "Invalid date format (expected YYYY-MM or YYYY-MM-DD)"}), 400
+    if end < start:
+        return jsonify({"error": "'to' cannot be before 'from'"}), 400
+
+    current_user = get_jwt_identity()
+    user = User.query.filter_by(username=current_user).first()
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+
+    return jsonify(build_revenue_report(user.id, granularity, start, end)), 200
+
+# -------------------- Search --------------------
+@routes_bp.route("/search", methods=["GET"])
+@jwt_required()
+@replica_reads
+def search():
+    """ Ranked full-text search over the user's clients, invoices and line items """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        per_page = min(max(int(request.args.get("per_page", 20)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+
+    if not text_search.is_supported(db):
+        return jsonify({"error": "Search is not available for this database"}), 501
+
+    current_user = get_jwt_identity()
+    user = User.query.filter_by(username=current_user).first()
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+
+    # Fetch one extra row to know whether another page exists
+    results = text_search.search(db, user.id, query, limit=per_page + 1, offset=(page - 1) * per_page)
+
+    return jsonify({
+        "results": results[:per_page],
+        "page": page,
+        "per_page": per_page,
+        "has_more": len(results) > per_page
+    }), 200
+
+# -------------------- Errors --------------------
+@routes_bp.app_errorhandler(TenantMovingError)
+def handle_tenant_moving(error):
+    """ Writes are refused for a few moments while the account moves to another shard """
+    db.session.rollback()
+    response = jsonify({"message": "Your account is being migrated. Please retry shortly."})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+# -------------------- Monitoring --------------------
+@routes_bp.route("/metrics/db-pools", methods=["GET"])
+def get_db_pool_stats():
+    """ Expose connection pool statistics for the primary and replica engines, when METRICS_ENABLED """
+    if not app.config["METRICS_ENABLED"]:
+        return jsonify({"message": "Not found"}), 404
+    return jsonify(pool_stats(db)), 200
+
+@routes_bp.route("/metrics/rate-limits", methods=["GET"])
+def get_rate_limit_stats():
+    """ Expose allowed/rejected counters of the rate-limited auth routes, when METRICS_ENABLED """
+    if not app.config["METRICS_ENABLED"]:
+        return jsonify({"message": "Not found"}), 404
+    return jsonify(rate_limit_stats()), 200
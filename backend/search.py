@@ -0,0 +1,149 @@
+import re
+
+from sqlalchemy import text
+
+from models import Invoice
+
+# Document kinds stored in the index. On SQLite the FTS rowid is derived from the
+# source row id and the kind, so updates and deletes hit the index by primary key.
+KINDS = {"client": 0, "invoice": 1, "invoice_item": 2}
+
+# Text indexed for each table (PostgreSQL expression indexes must match these exactly)
+CLIENT_TEXT = "coalesce(client.name, '') || ' ' || coalesce(client.business_name, '') || ' ' || coalesce(client.email, '')"
+INVOICE_TEXT = "coalesce(invoice.invoice_number, '')"
+ITEM_TEXT = "coalesce(invoice_item.description, '')"
+
+# -------------------- SQLite (FTS5) --------------------
+_SQLITE_TABLE = """
+CREATE VIRTUAL TABLE search_index USING fts5(
+    body, kind UNINDEXED, user_id UNINDEXED, invoice_id UNINDEXED, tokenize = 'unicode61'
+)
+"""
+
+_SQLITE_SOURCES = {
+    "client": ("client", "NEW.user_id", "NULL", CLIENT_TEXT),
+    "invoice": ("invoice", "NEW.user_id", "NEW.id", INVOICE_TEXT),
+    "invoice_item": (
+        "invoice_item",
+        "(SELECT user_id FROM invoice WHERE invoice.id = NEW.invoice_id)",
+        "NEW.invoice_id",
+        ITEM_TEXT,
+    ),
+}
+
+def _sqlite_triggers():
+    """ Yields the triggers that keep search_index in sync with its source tables """
+    for kind, (table, user_id, invoice_id, body) in _SQLITE_SOURCES.items():
+        offset = KINDS[kind]
+        body = body.replace(f"{table}.", "NEW.")
+        insert = (
+            f"INSERT INTO search_index (rowid, body, kind, user_id, invoice_id) "
+            f"VALUES (NEW.id * 3 + {offset}, {body}, '{kind}', {user_id}, {invoice_id});"
+        )
+        delete = f"DELETE FROM search_index WHERE rowid = OLD.id * 3 + {offset};"
+        yield f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert} END"
+        yield f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END"
+        yield f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete} END"
+
+def _sqlite_backfill():
+    """ Yields statements that index rows created before the index existed """
+    yield (
+        f"INSERT INTO search_index (rowid, body, kind, user_id, invoice_id) "
+        f"SELECT id * 3 + {KINDS['client']}, {CLIENT_TEXT}, 'client', user_id, NULL FROM client"
+    )
+    yield (
+        f"INSERT INTO search_index (rowid, body, kind, user_id, invoice_id) "
+        f"SELECT id * 3 + {KINDS['invoice']}, {INVOICE_TEXT}, 'invoice', user_id, id FROM invoice"
+    )
+    yield (
+        f"INSERT INTO search_index (rowid, body, kind, user_id, invoice_id) "
+        f"SELECT invoice_item.id * 3 + {KINDS['invoice_item']}, {ITEM_TEXT}, 'invoice_item', "
+        f"invoice.user_id, invoice.id FROM invoice_item JOIN invoice ON invoice.id = invoice_item.invoice_id"
+    )
+
+_SQLITE_QUERY = """
+SELECT kind, rowid / 3 AS id, invoice_id, body AS text, -bm25(search_index) AS score
+FROM search_index
+WHERE search_index MATCH :query AND user_id = :user_id
+ORDER BY bm25(search_index)
+LIMIT :limit OFFSET :offset
+"""
+
+# -------------------- PostgreSQL (tsvector + GIN) --------------------
+_POSTGRES_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS ix_client_search ON client USING GIN (to_tsvector('simple', {CLIENT_TEXT}))",
+    f"CREATE INDEX IF NOT EXISTS ix_invoice_search ON invoice USING GIN (to_tsvector('simple', {INVOICE_TEXT}))",
+    f"CREATE INDEX IF NOT EXISTS ix_invoice_item_search ON invoice_item USING GIN (to_tsvector('simple', {ITEM_TEXT}))",
+]
+
+_POSTGRES_QUERY = f"""
+SELECT 'client' AS kind, client.id AS id, NULL AS invoice_id, {CLIENT_TEXT} AS text,
+       ts_rank(to_tsvector('simple', {CLIENT_TEXT}), q) AS score
+FROM client, to_tsquery('simple', :query) AS q
+WHERE client.user_id = :user_id AND to_tsvector('simple', {CLIENT_TEXT}) @@ q
+UNION ALL
+SELECT 'invoice', invoice.id, invoice.id, {INVOICE_TEXT},
+       ts_rank(to_tsvector('simple', {INVOICE_TEXT}), q)
+FROM invoice, to_tsquery('simple', :query) AS q
+WHERE invoice.user_id = :user_id AND to_tsvector('simple', {INVOICE_TEXT}) @@ q
+UNION ALL
+SELECT 'invoice_item', invoice_item.id, invoice.id, {ITEM_TEXT},
+       ts_rank(to_tsvector('simple', {ITEM_TEXT}), q)
+FROM invoice_item JOIN invoice ON invoice.id = invoice_item.invoice_id, to_tsquery('simple', :query) AS q
+WHERE invoice.user_id = :user_id AND to_tsvector('simple', {ITEM_TEXT}) @@ q
+ORDER BY score DESC
+LIMIT :limit OFFSET :offset
+"""
+
+# -------------------- Public API --------------------
+def install_search_index(engine):
+    """
+    Creates the full-text index for a database holding tenant tables (the primary
+    or a shard) if it does not exist yet. SQLite gets an FTS5 table kept in sync
+    by triggers; PostgreSQL gets GIN expression indexes, which the database
+    maintains on every write.
+    """
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")
+            ).first()
+            if not exists:
+                conn.execute(text(_SQLITE_TABLE))
+                for statement in _sqlite_backfill():
+                    conn.execute(text(statement))
+            for statement in _sqlite_triggers():
+                conn.execute(text(statement))
+        elif dialect == "postgresql":
+            for statement in _POSTGRES_INDEXES:
+                conn.execute(text(statement))
+
+def is_supported(db):
+    """ Checks whether full-text search is available for the configured database """
+    return db.engine.dialect.name in ("sqlite", "postgresql")
+
+def search(db, user_id, query, limit, offset):
+    """
+    Runs a ranked, prefix-matching search over the user's clients, invoices and
+    line items. Returns a list of dicts ordered by descending score.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return []
+
+    # The index lives next to the tenant tables, on the user's shard
+    bind = db.session.get_bind(mapper=Invoice.__mapper__)
+    if bind.dialect.name == "sqlite":
+        statement = _SQLITE_QUERY
+        match = " ".join(f'"{term}"*' for term in terms)
+    else:
+        statement = _POSTGRES_QUERY
+        match = " & ".join(f"{term}:*" for term in terms)
+
+    rows = db.session.execute(
+        text(statement),
+        {"query": match, "user_id": user_id, "limit": limit, "offset": offset},
+        bind_arguments={"bind": bind},
+    ).mappings()
+    return [dict(row) for row in rows]
@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from flask.sessions import SessionInterface
+from flask_session import Session
+from flask_session.sqlalchemy import SqlAlchemySessionInterface
+from sqlalchemy import Index
+
+# -------------------- Session Interfaces --------------------
+class NullSessionInterface(SessionInterface):
+    """ Stateless mode: no session is loaded, stored or sent as a cookie """
+
+    def open_session(self, app, request):
+        return self.make_null_session(app)
+
+    def save_session(self, app, session, response):
+        pass
+
+class StatelessBearerSessionInterface(SessionInterface):
+    """
+    Wraps a server-side session interface so requests authenticated with a JWT
+    bearer token never touch session storage: they get a null session, which
+    Flask does not save.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def open_session(self, app, request):
+        if request.headers.get("Authorization", "").startswith("Bearer "):
+            return self.make_null_session(app)
+        return self.inner.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        return self.inner.save_session(app, session, response)
+
+class PrunedSqlAlchemySessionInterface(SqlAlchemySessionInterface):
+    """
+    Flask-Session's SQLAlchemy store with an index on expiry, and expired rows
+    deleted in batches by the prune-sessions job instead of during requests.
+    """
+
+    def __init__(self, app, client, prune_batch_size, **kwargs):
+        super().__init__(app, client=client, cleanup_n_requests=None, **kwargs)
+        self.prune_batch_size = prune_batch_size
+
+        table = self.sql_session_model.__table__
+        expiry_index = Index(f"ix_{table.name}_expiry", table.c.expiry)
+        with app.app_context():
+            expiry_index.create(bind=client.engine, checkfirst=True)
+
+    def _delete_expired_sessions(self):
+        self.prune_expired(self.prune_batch_size)
+
+    def prune_expired(self, batch_size):
+        """
+        Deletes expired sessions in batches over the expiry index, committing after
+        each batch to keep lock times short. Returns the number of rows deleted.
+        """
+        db, model = self.client, self.sql_session_model
+        deleted = 0
+        now = datetime.utcnow()  # Flask-Session stores naive UTC expiry times
+        while True:
+            batch = db.select(model.id).where(model.expiry <= now).limit(batch_size)
+            ids = db.session.execute(batch).scalars().all()
+            if not ids:
+                return deleted
+            db.session.execute(
+                db.delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            deleted += len(ids)
+
+# -------------------- Setup --------------------
+def _cachelib_client(url):
+    """ Shared cachelib store for the sessions; entries expire through the store's own TTL """
+    from cachelib import RedisCache
+    import redis  # Optional dependency, only needed for the cachelib session backend
+
+    return RedisCache(host=redis.Redis.from_url(url))
+
+def init_sessions(app, db):
+    """
+    Installs the session interface selected by SESSION_TYPE:
+      - "null": stateless, nothing is stored (the default, auth is JWT-based)
+      - "sqlalchemy": sessions table in the app database with indexed expiry
+      - "cachelib": shared cache at SESSION_CACHELIB_URL
+      - anything else is handed to Flask-Session as configured
+    In the server-side modes, requests carrying a JWT bearer token skip the store.
+    """
+    config = app.config
+    session_type = config["SESSION_TYPE"]
+
+    if session_type == "null":
+        app.session_interface = NullSessionInterface()
+        return
+
+    if session_type == "sqlalchemy":
+        inner = PrunedSqlAlchemySessionInterface(
+            app,
+            client=db,
+            prune_batch_size=config["SESSION_PRUNE_BATCH_SIZE"],
+            key_prefix=config["SESSION_KEY_PREFIX"],
+            permanent=config["SESSION_PERMANENT"],
+            table=config["SESSION_SQLALCHEMY_TABLE"],
+        )
+    else:
+        if session_type == "cachelib":
+            if not config["SESSION_CACHELIB_URL"]:
+                raise ValueError("SESSION_CACHELIB_URL is required when SESSION_TYPE is 'cachelib'")
+            config["SESSION_CACHELIB"] = _cachelib_client(config["SESSION_CACHELIB_URL"])
+        Session(app)
+        inner = app.session_interface
+
+    app.session_interface = StatelessBearerSessionInterface(inner)
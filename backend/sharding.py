@@ -0,0 +1,321 @@
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from cachetools import TTLCache
+from flask import current_app, g, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import func, insert, text
+
+from database import USE_ID_COUNTER
+from models import (
+    db, User, TenantShard, Client, Invoice, InvoiceItem, ArchivedInvoice, ArchivedInvoiceItem,
+    RecurringInvoice, RevenueBucket, IdCounter, TENANT_MODELS,
+)
+from search import install_search_index
+
+DEFAULT_SHARD = "default"  # The primary database, which also holds the directory
+
+Tenant = namedtuple("Tenant", ["user_id", "shard", "moving"])
+
+class TenantMovingError(Exception):
+    """ Raised on a write to a tenant whose rows are being moved to another shard """
+
+def bind_key(shard):
+    """ Flask-SQLAlchemy bind key of a shard name """
+    return None if shard == DEFAULT_SHARD else shard
+
+# -------------------- Shard Map --------------------
+class ShardMap:
+    """
+    Resolves JWT identities to their tenant's shard through the directory on the
+    primary, caching the answer for SHARD_MAP_CACHE_TTL_SECONDS. Registered as
+    app.extensions["sharding"] and consulted by RoutingSession for tenant tables.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._cache = TTLCache(maxsize=app.config["SHARD_MAP_CACHE_SIZE"], ttl=app.config["SHARD_MAP_CACHE_TTL_SECONDS"])
+        self._cache_lock = threading.Lock()
+
+    def shards(self):
+        """ Names of every shard, the primary first """
+        return [DEFAULT_SHARD] + [key for key in self.app.config["SQLALCHEMY_BINDS"] if key.startswith("shard_")]
+
+    def _load(self, identity):
+        # Reads the directory on its own connection, so it never recurses into the routing session
+        statement = (
+            db.select(User.id, TenantShard.shard, TenantShard.moving)
+            .outerjoin(TenantShard, TenantShard.user_id == User.id)
+            .where(User.username == identity)
+        )
+        with db.engine.connect() as conn:
+            row = conn.execute(statement).first()
+        if row is None:
+            return None
+        return Tenant(row.id, row.shard or DEFAULT_SHARD, bool(row.moving))
+
+    def tenant(self, identity, fresh=False):
+        """ Returns the Tenant for a username, or None when the user does not exist """
+        if not fresh:
+            with self._cache_lock:
+                tenant = self._cache.get(identity)
+            if tenant is not None:
+                return tenant
+        tenant = self._load(identity)
+        if tenant is not None:
+            with self._cache_lock:
+                self._cache[identity] = tenant
+        return tenant
+
+    def current_shard(self):
+        """ Bind key for tenant tables: the shard pinned with use_shard, else the JWT identity's """
+        if "shard" in g:
+            return g.shard
+        tenant = current_tenant() if has_request_context() else None
+        return bind_key(tenant.shard) if tenant is not None else None
+
+    def check_writable(self):
+        """ Raises TenantMovingError if the current tenant is being moved or was moved since it was cached """
+        if "shard" in g or not has_request_context():
+            return
+        identity = _current_identity()
+        if identity is None:
+            return
+        cached = current_tenant()
+        fresh = self.tenant(identity, fresh=True)
+        if fresh is not None and (fresh.moving or (cached is not None and fresh.shard != cached.shard)):
+            g.pop("tenant", None)
+            raise TenantMovingError(identity)
+
+def _current_identity():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+def current_tenant():
+    """ Tenant of the current JWT identity, resolved once per request """
+    if "tenant" not in g:
+        identity = _current_identity()
+        g.tenant = current_app.extensions["sharding"].tenant(identity) if identity is not None else None
+    return g.tenant
+
+def current_user_id():
+    """ Directory id of the current JWT identity, without querying the user table on every request """
+    tenant = current_tenant()
+    return tenant.user_id if tenant is not None else None
+
+@contextmanager
+def use_shard(shard):
+    """ Routes tenant tables to the given shard, for jobs that work across tenants """
+    pinned, previous = "shard" in g, g.get("shard")
+    g.shard = bind_key(shard)
+    try:
+        yield
+    finally:
+        if pinned:
+            g.shard = previous
+        else:
+            g.pop("shard", None)
+
+def for_each_shard(job):
+    """ Runs job(shard) once per shard with tenant tables routed to it; returns the results """
+    results = []
+    for shard in current_app.extensions["sharding"].shards():
+        with use_shard(shard):
+            results.append(job(shard))
+    return results
+
+def moving_user_ids():
+    """
+    Tenants periodic jobs must leave alone on the current shard: those being moved,
+    and those moved away whose rows here are not deleted yet. Read fresh from the
+    directory, so jobs call it once per batch.
+    """
+    shard = g.get("shard") or DEFAULT_SHARD
+    statement = db.select(TenantShard.user_id).where(
+        db.or_(TenantShard.moving.is_(True), TenantShard.draining_from == shard)
+    )
+    with db.engine.connect() as conn:
+        return set(conn.execute(statement).scalars())
+
+def place_tenant(user):
+    """ Assigns a new user to one of the SHARD_PLACEMENT shards. The caller commits. """
+    placement = current_app.config["SHARD_PLACEMENT"]
+    db.session.flush()  # Assigns user.id
+    db.session.add(TenantShard(user_id=user.id, shard=placement[user.id % len(placement)]))
+
+# -------------------- Id Ranges --------------------
+# Tenant tables whose ids are generated on the shard, with the tables that share their ids
+ID_MODELS = {
+    Client: (Client,),
+    Invoice: (Invoice, ArchivedInvoice),
+    InvoiceItem: (InvoiceItem, ArchivedInvoiceItem),
+    RecurringInvoice: (RecurringInvoice,),
+    RevenueBucket: (RevenueBucket,),
+}
+
+def id_range(shard):
+    """
+    First and last id a shard assigns. Ranges are disjoint, so ids are unique
+    across shards and rows keep them when their tenant is moved.
+    """
+    size = current_app.config["SHARD_ID_RANGE"]
+    index = 0 if shard == DEFAULT_SHARD else int(shard.rsplit("_", 1)[1]) + 1
+    return index * size + 1, (index + 1) * size
+
+def _first_free_id(conn, models, first, last):
+    """ Lowest id of the range above every id the tables already use in it """
+    used = [
+        conn.execute(db.select(func.max(model.id)).where(model.id.between(first, last))).scalar() or 0
+        for model in models
+    ]
+    return max([first - 1] + used) + 1
+
+def reserve_id_range(conn, shard):
+    """
+    Points the shard's id generators at its own range: the id_counter rows where
+    SQLite is in use (see database.USE_ID_COUNTER), otherwise the Postgres
+    sequences, bounded to the range. Neither is advanced by rows copied in with
+    their ids, so nothing needs resetting after a move. A counter is never left
+    below an id already used in the range.
+    """
+    first, last = id_range(shard)
+    counters = IdCounter.__table__
+    for model, sharing in ID_MODELS.items():
+        table = model.__table__
+        if USE_ID_COUNTER:
+            next_id = conn.execute(
+                db.select(counters.c.next_id).where(counters.c.table_name == table.name)
+            ).scalar()
+            # Rows inserted without the counter (by a migration, say) push it past their ids
+            free_id = _first_free_id(conn, sharing, first, last)
+            if next_id is not None and free_id <= next_id <= last + 1:
+                continue
+            conn.execute(db.delete(counters).where(counters.c.table_name == table.name))
+            conn.execute(insert(counters).values(table_name=table.name, next_id=free_id))
+        elif conn.dialect.name == "postgresql":
+            sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table.name}).scalar()
+            last_value = conn.execute(text(f"SELECT last_value FROM {sequence}")).scalar()
+            restart = ""
+            if not first <= last_value <= last:
+                restart = f" RESTART WITH {_first_free_id(conn, sharing, first, last)}"
+            conn.execute(text(f"ALTER SEQUENCE {sequence} MINVALUE {first} MAXVALUE {last}{restart}"))
+
+# -------------------- Resharding --------------------
+def _copy_table(source, target, model, where, batch_size):
+    """ Copies the selected rows of a table between shards in batches, ids included. Returns the row count. """
+    table = model.__table__
+    copied = 0
+    result = source.execute(
+        db.select(table).where(where).order_by(table.c.id).execution_options(yield_per=batch_size)
+    )
+    for rows in result.partitions():
+        target.execute(insert(table), [dict(row._mapping) for row in rows])
+        copied += len(rows)
+    return copied
+
+def _copy_tenant(source, target, user_id, batch_size):
+    """
+    Copies every tenant row from the source shard to the target shard as-is, the
+    way the archive copies invoices, so ids held by caches, replayed responses
+    and clients keep pointing at the same rows. Returns the number of invoices.
+    """
+    _copy_table(source, target, Client, Client.user_id == user_id, batch_size)
+    _copy_table(source, target, RecurringInvoice, RecurringInvoice.user_id == user_id, batch_size)
+    moved = 0
+    for parent, child in [(Invoice, InvoiceItem), (ArchivedInvoice, ArchivedInvoiceItem)]:
+        moved += _copy_table(source, target, parent, parent.user_id == user_id, batch_size)
+        owned = db.select(parent.id).where(parent.user_id == user_id)
+        _copy_table(source, target, child, child.invoice_id.in_(owned), batch_size)
+    _copy_table(source, target, RevenueBucket, RevenueBucket.user_id == user_id, batch_size)
+    return moved
+
+def _delete_tenant(engine, user_id, batch_size):
+    """ Deletes a tenant's rows from a shard, children first, one batch per transaction """
+    parents = [(Invoice, InvoiceItem), (ArchivedInvoice, ArchivedInvoiceItem)]
+    for parent, child in parents:
+        while True:
+            with engine.begin() as conn:
+                ids = conn.execute(
+                    db.select(parent.id).where(parent.user_id == user_id).limit(batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                conn.execute(db.delete(child.__table__).where(child.invoice_id.in_(ids)))
+                conn.execute(db.delete(parent.__table__).where(parent.id.in_(ids)))
+    for model in (RevenueBucket, RecurringInvoice, Client):
+        while True:
+            with engine.begin() as conn:
+                ids = conn.execute(
+                    db.select(model.id).where(model.user_id == user_id).limit(batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                conn.execute(db.delete(model.__table__).where(model.id.in_(ids)))
+
+def _set_tenant_state(user_id, **values):
+    """ Updates the tenant's shard map entry, creating it for tenants still implicitly on the primary """
+    entry = db.session.get(TenantShard, user_id)
+    if entry is None:
+        entry = TenantShard(user_id=user_id, shard=DEFAULT_SHARD, moving=False)
+        db.session.add(entry)
+    for key, value in values.items():
+        setattr(entry, key, value)
+    db.session.commit()
+
+def move_tenant(username, target_shard, batch_size, grace_seconds, settle_seconds=0):
+    """
+    Moves a tenant's rows to another shard while the tenant stays online:
+      1. the tenant is marked as moving, so its writes answer 503 and are retried
+         (reads keep being served from the source shard) and periodic jobs skip it;
+      2. after settle_seconds for in-flight writes, its rows are copied to the
+         target in one transaction, keeping their ids;
+      3. the shard map is flipped to the target;
+      4. after grace_seconds, long enough for every worker's cached shard map
+         entry to expire, the rows are deleted from the source in batches. Jobs
+         on the source keep skipping the tenant until then.
+    Returns the number of invoices moved.
+    """
+    sharding = current_app.extensions["sharding"]
+    if target_shard not in sharding.shards():
+        raise ValueError(f"Unknown shard '{target_shard}'")
+    tenant = sharding.tenant(username, fresh=True)
+    if tenant is None:
+        raise ValueError(f"Unknown user '{username}'")
+    if tenant.shard == target_shard:
+        return 0
+
+    _set_tenant_state(tenant.user_id, moving=True)
+    try:
+        time.sleep(settle_seconds)
+        source_engine = db.engines[bind_key(tenant.shard)]
+        with source_engine.connect() as source, db.engines[bind_key(target_shard)].begin() as target:
+            moved = _copy_tenant(source, target, tenant.user_id, batch_size)
+    except Exception:
+        _set_tenant_state(tenant.user_id, moving=False)
+        raise
+    _set_tenant_state(tenant.user_id, shard=target_shard, moving=False, draining_from=tenant.shard)
+
+    time.sleep(grace_seconds)
+    _delete_tenant(source_engine, tenant.user_id, batch_size)
+    _set_tenant_state(tenant.user_id, draining_from=None)
+    return moved
+
+# -------------------- Setup --------------------
+def init_sharding(app):
+    """
+    Registers the shard map, creates the tenant tables and search index on every
+    shard, and points each shard's id generators at its own id range
+    """
+    app.extensions["sharding"] = sharding = ShardMap(app)
+    tables = [model.__table__ for model in TENANT_MODELS]
+    with app.app_context():
+        for shard in sharding.shards():
+            engine = db.engines[bind_key(shard)]
+            db.metadata.create_all(engine, tables=tables)
+            install_search_index(engine)
+            with engine.begin() as conn:
+                reserve_id_range(conn, shard)
@@ -0,0 +1,50 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Config is read from the environment when app.py is imported, so the databases are set up first:
+# the primary ("default") and one shard ("shard_0"), where new tenants are placed
+_DATA_DIR = tempfile.mkdtemp(prefix="freelancebill-tests-")
+os.environ.update(
+    FRONTEND_URL="http://localhost:3000",
+    SECRET_KEY="test-secret",
+    JWT_SECRET_KEY="test-jwt-secret-that-is-long-enough-for-hs256",
+    SQLALCHEMY_DATABASE_URI=f"sqlite:///{_DATA_DIR}/primary.db",
+    SQLALCHEMY_SHARD_URIS=f"sqlite:///{_DATA_DIR}/shard_0.db",
+    SHARD_PLACEMENT="shard_0",
+    SHARD_MOVE_SETTLE_SECONDS="0",
+    RATELIMIT_ENABLED="False",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+from models import db, User  # noqa: E402
+from sharding import place_tenant  # noqa: E402
+
+_usernames = (f"user{n}" for n in itertools.count(1))
+
+@pytest.fixture
+def app():
+    return flask_app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def make_user(app):
+    """ Creates a verified user placed on a shard and returns (username, auth headers) """
+    def make_user():
+        username = next(_usernames)
+        with app.app_context():
+            user = User(username=username, name=username, email=f"{username}@example.com", is_verified=True)
+            db.session.add(user)
+            place_tenant(user)
+            db.session.commit()
+            token = create_access_token(identity=username)
+        return username, {"Authorization": f"Bearer {token}"}
+    return make_user
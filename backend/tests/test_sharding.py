@@ -0,0 +1,83 @@
+from models import db, TenantShard
+from sharding import id_range, move_tenant
+
+def invoice_payload(client_id, due_date="2020-02-01"):
+    return {
+        "client_id": client_id,
+        "issue_date": "2020-01-01",
+        "due_date": due_date,
+        "currency": "USD",
+        "tax_rate": 10,
+        "payment_method": "Cash",
+        "payment_details": "Paid in person",
+        "items": [{"type": "service", "unit": "hour", "description": "Design work", "quantity": 2, "rate": 50}],
+    }
+
+def create_invoices(client, headers, client_id, count):
+    ids = []
+    for _ in range(count):
+        response = client.post("/invoice", json=invoice_payload(client_id), headers=headers)
+        assert response.status_code == 201, response.get_json()
+        ids.append(response.get_json()["invoice_id"])
+    return ids
+
+def move(app, username, shard):
+    with app.app_context():
+        move_tenant(username, shard, batch_size=2, grace_seconds=0)
+        app.extensions["sharding"].tenant(username, fresh=True)  # As if every worker's cached entry expired
+
+def set_moving(app, username, moving):
+    with app.app_context():
+        tenant = app.extensions["sharding"].tenant(username, fresh=True)
+        db.session.get(TenantShard, tenant.user_id).moving = moving
+        db.session.commit()
+
+def test_moved_tenant_keeps_ids_and_numbering(app, client, make_user):
+    username, headers = make_user()
+    client_id = client.post("/client", json={"name": "Acme", "email": "billing@acme.com"}, headers=headers).get_json()["client_id"]
+    moved_ids = create_invoices(client, headers, client_id, 3)
+    with app.app_context():
+        first, last = id_range("shard_0")
+    assert all(first <= invoice_id <= last for invoice_id in moved_ids)
+
+    # Onto the primary, whose id range lies below the shard's
+    move(app, username, "default")
+    invoices = client.get("/invoices", headers=headers).get_json()
+    assert sorted(invoice["id"] for invoice in invoices) == moved_ids
+    assert {invoice["client_id"] for invoice in invoices} == {client_id}
+
+    new_ids = create_invoices(client, headers, client_id, 2)
+    with app.app_context():
+        first, last = id_range("default")
+    assert all(first <= invoice_id <= last for invoice_id in new_ids)
+
+    invoices = client.get("/invoices", headers=headers).get_json()
+    numbers = {invoice["id"]: invoice["invoice_number"] for invoice in invoices}
+    assert [numbers[invoice_id] for invoice_id in moved_ids + new_ids] == ["1", "2", "3", "4", "5"]
+
+    # And back again, next to the rows the move left on the primary's id counter
+    move(app, username, "shard_0")
+    create_invoices(client, headers, client_id, 1)
+    invoices = client.get("/invoices", headers=headers).get_json()
+    assert sorted(int(invoice["invoice_number"]) for invoice in invoices) == [1, 2, 3, 4, 5, 6]
+
+def test_reads_keep_working_while_moving(app, client, make_user):
+    username, headers = make_user()
+    client_id = client.post("/client", json={"name": "Acme", "email": "billing@acme.com"}, headers=headers).get_json()["client_id"]
+    (invoice_id,) = create_invoices(client, headers, client_id, 1)  # Overdue, not marked yet
+
+    set_moving(app, username, True)
+    try:
+        response = client.get("/invoices", headers=headers)
+        assert response.status_code == 200
+        assert [invoice["status"] for invoice in response.get_json()] == ["Unpaid"]
+        assert client.get(f"/invoice/{invoice_id}", headers=headers).status_code == 200
+
+        response = client.post("/client", json={"name": "Blocked", "email": "b@example.com"}, headers=headers)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"]
+    finally:
+        set_moving(app, username, False)
+
+    response = client.get(f"/invoice/{invoice_id}", headers=headers)
+    assert response.get_json()["status"] == "Overdue"
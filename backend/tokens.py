@@ -0,0 +1,82 @@
+import hashlib
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from config import Config
+from models import db, OneTimeToken, TokenPurpose
+
+TOKEN_TTLS = {
+    TokenPurpose.EMAIL_VERIFICATION: timedelta(hours=Config.VERIFICATION_TOKEN_TTL_HOURS),
+    TokenPurpose.PASSWORD_RESET: timedelta(minutes=Config.PASSWORD_RESET_TOKEN_TTL_MINUTES),
+}
+
+def utcnow():
+    """ Current UTC time as a naive datetime, matching the DateTime columns """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def hash_token(token: str) -> str:
+    """
+    Hashes a raw token for storage and lookup. Tokens are 256-bit random values,
+    so a plain SHA-256 digest is enough to keep a database leak from exposing them.
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def issue_token(user, purpose: TokenPurpose) -> str:
+    """
+    Creates a one-time token for the user and returns the raw value to email.
+    Any earlier unused token with the same purpose is invalidated. The caller commits.
+    """
+    now = utcnow()
+    OneTimeToken.query.filter_by(user_id=user.id, purpose=purpose, consumed_at=None).update(
+        {"consumed_at": now}, synchronize_session=False
+    )
+
+    token = secrets.token_urlsafe(32)
+    db.session.add(OneTimeToken(
+        user_id=user.id,
+        purpose=purpose,
+        token_hash=hash_token(token),
+        created_at=now,
+        expires_at=now + TOKEN_TTLS[purpose],
+    ))
+    return token
+
+def find_token(token: str, purpose: TokenPurpose):
+    """ Returns the matching unexpired, unconsumed token row, or None """
+    return OneTimeToken.query.filter(
+        OneTimeToken.token_hash == hash_token(token),
+        OneTimeToken.purpose == purpose,
+        OneTimeToken.consumed_at.is_(None),
+        OneTimeToken.expires_at > utcnow(),
+    ).first()
+
+def consume_token(token_row) -> bool:
+    """
+    Marks a token as used. The conditional UPDATE makes concurrent requests with
+    the same token race safely: only one of them sees a row updated. The caller commits.
+    """
+    result = db.session.execute(
+        db.update(OneTimeToken)
+        .where(OneTimeToken.id == token_row.id, OneTimeToken.consumed_at.is_(None))
+        .values(consumed_at=utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def purge_tokens(batch_size: int) -> int:
+    """
+    Deletes expired tokens in batches over the expires_at index, committing after
+    each batch to keep lock times short. Returns the number of rows deleted.
+    """
+    deleted = 0
+    now = utcnow()
+    while True:
+        batch = db.select(OneTimeToken.id).where(OneTimeToken.expires_at < now).limit(batch_size)
+        ids = db.session.execute(batch).scalars().all()
+        if not ids:
+            return deleted
+        db.session.execute(
+            db.delete(OneTimeToken).where(OneTimeToken.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        deleted += len(ids)
@@ -16,6 +16,7 @@ import InvoiceForm from "./components/InvoiceForm";
 import ClientForm from "./components/ClientForm";
 import Navbar from "./components/Navbar";
 import Footer from "./components/Footer";
+import { apiFetch } from "./api";
 
 const API_URL = process.env.REACT_APP_API_URL;
 
@@ -32,7 +33,7 @@ export const fetchUserDetails = async (setUser, setLoadingUser) => {
 
   setLoadingUser(true);
   try {
-    const response = await fetch(`${API_URL}/user`, {
+    const response = await apiFetch(`${API_URL}/user`, {
       headers: { Authorization: `Bearer ${token}` },
     });
     if (!response.ok) {
@@ -54,7 +55,7 @@ export const updateUserDetails = async (updatedData, fetchUserDetails) => {
   if (!token) return;
 
   try {
-    const response = await fetch(`${API_URL}/user`, {
+    const response = await apiFetch(`${API_URL}/user`, {
       method: "PUT",
       headers: { "Content-Type": "application/json", Authorization: `Bearer ${token}` },
       body: JSON.stringify(updatedData),
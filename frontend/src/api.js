@@ -0,0 +1,32 @@
+// The API returns this header after a write with a deadline (epoch seconds) until
+import { apiFetch } from "../api";
+// which reads should go to the primary database. Echoing it back keeps the
+import { apiFetch } from "../api";
+// following reads consistent even when another worker serves them.
+import { apiFetch } from "../api";
+const READ_PRIMARY_HEADER = "X-Read-Primary-Until";
+import { apiFetch } from "../api";
+const READ_PRIMARY_KEY = "readPrimaryUntil";
+import { apiFetch } from "../api";
+
+import { apiFetch } from "../api";
+export const apiFetch = async (url, options = {}) => {
+import { apiFetch } from "../api";
+  const headers = { ...options.headers };
+import { apiFetch } from "../api";
+  const readPrimaryUntil = sessionStorage.getItem(READ_PRIMARY_KEY);
+import { apiFetch } from "../api";
+  if (readPrimaryUntil) headers[READ_PRIMARY_HEADER] = readPrimaryUntil;
+import { apiFetch } from "../api";
+
+import { apiFetch } from "../api";
+  const response = await apiFetch(url, { ...options, headers });
+import { apiFetch } from "../api";
+  const marker = response.headers.get(READ_PRIMARY_HEADER);
+import { apiFetch } from "../api";
+  if (marker) sessionStorage.setItem(READ_PRIMARY_KEY, marker);
+import { apiFetch } from "../api";
+  return response;
+import { apiFetch } from "../api";
+};
+import { apiFetch } from "../api";
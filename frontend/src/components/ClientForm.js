@@ -14,6 +14,7 @@ import { ArrowBack } from "@mui/icons-material";
 import { useNavigate } from "react-router-dom";
 import PhoneInput from "react-phone-input-2";
 import "react-phone-input-2/lib/style.css";
+import { apiFetch } from "../api";
 
 const API_URL = process.env.REACT_APP_API_URL;
 
@@ -68,7 +69,7 @@ const ClientForm = () => {
         .filter((field) => field && field.trim() !== "")
         .join(", ");
 
-      const res = await fetch(`${API_URL}/client`, {
+      const res = await apiFetch(`${API_URL}/client`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
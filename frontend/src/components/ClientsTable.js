@@ -6,6 +6,7 @@ import {
 } from "@mui/material";
 import { Edit, Add } from "@mui/icons-material";
 import { Link } from "react-router-dom";
+import { apiFetch } from "../api";
 
 const API_URL = process.env.REACT_APP_API_URL;
 
@@ -43,7 +44,7 @@ export const ClientsTable = ({ clients, loading, fetchClients }) => {
       const method = isAdding ? "POST" : "PUT";
       const url = isAdding ? `${API_URL}/client` : `${API_URL}/clients/${editingClient.id}`;
 
-      await fetch(url, {
+      await apiFetch(url, {
         method,
         headers: {
           "Content-Type": "application/json",
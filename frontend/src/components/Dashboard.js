@@ -21,6 +21,7 @@ import TopClientLoyaltyCard from "./TopClientLoyaltyCard";
 import TopClientRevenueCard from "./TopClientRevenueCard";
 import { fetchUserDetails, updateUserDetails } from "../App";
 import { ProfileCard } from "./ProfileCard";
+import { apiFetch } from "../api";
 
 const API_URL = process.env.REACT_APP_API_URL;
 
@@ -53,7 +54,7 @@ const Dashboard = () => {
   const fetchInvoices = async () => {
     setLoadingInvoices(true);
     try {
-      const response = await fetch(`${API_URL}/invoices`, {
+      const response = await apiFetch(`${API_URL}/invoices?expand=client`, {
         headers: { Authorization: `Bearer ${token}` },
       });
       if (!response.ok) throw new Error(response.statusText);
@@ -67,7 +68,7 @@ const Dashboard = () => {
   const fetchClients = async () => {
     setLoadingClients(true);
     try {
-      const response = await fetch(`${API_URL}/clients`, {
+      const response = await apiFetch(`${API_URL}/clients`, {
         headers: { Authorization: `Bearer ${token}` },
       });
       if (!response.ok) throw new Error(response.statusText);
@@ -84,7 +85,7 @@ const Dashboard = () => {
 
   const markAsPaid = async (invoiceId) => {
     try {
-      const response = await fetch(`${API_URL}/invoice/${invoiceId}/mark-paid`, {
+      const response = await apiFetch(`${API_URL}/invoice/${invoiceId}/mark-paid`, {
         method: "PUT",
         headers: { Authorization: `Bearer ${token}` },
       });
@@ -104,7 +105,7 @@ const Dashboard = () => {
   const markAsCancelled = async (invoiceId) => {
     console.log("Cancelling invoice:", invoiceId);
     try {
-      const response = await fetch(`${API_URL}/invoice/${invoiceId}/cancel`, {
+      const response = await apiFetch(`${API_URL}/invoice/${invoiceId}/cancel`, {
         method: "PUT",
         headers: {
           "Content-Type": "application/json",
@@ -26,6 +26,7 @@ import {
 import { Edit, Delete, Add, ArrowBack } from "@mui/icons-material";
 import { useNavigate } from "react-router-dom";
 import InvoiceSummary from "./InvoiceSummary"; // Import InvoiceSummary component
+import { apiFetch } from "../api";
 
 const API_URL = process.env.REACT_APP_API_URL;
 
@@ -63,7 +64,7 @@ const InvoiceForm = () => {
   }, []);
 
   const fetchClients = async () => {
-    const response = await fetch(`${API_URL}/clients`, {
+    const response = await apiFetch(`${API_URL}/clients`, {
       headers: { Authorization: `Bearer ${token}` },
     });
     const data = await response.json();
@@ -203,7 +204,7 @@ const InvoiceForm = () => {
     try {
       console.log("Submitting invoice:", invoiceData); // Log before sending
   
-      const response = await fetch(`${API_URL}/invoice`, {
+      const response = await apiFetch(`${API_URL}/invoice`, {
         method: "POST",
         headers: { "Content-Type": "application/json", Authorization: `Bearer ${token}` },
         body: JSON.stringify(invoiceData),
@@ -234,7 +235,7 @@ const InvoiceForm = () => {
     setIsSavingClient(true); // Show loading spinner
 
     try {
-      const response = await fetch(`${API_URL}/client`, {
+      const response = await apiFetch(`${API_URL}/client`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
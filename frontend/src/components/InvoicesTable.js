@@ -20,6 +20,7 @@ import { Link } from "react-router-dom";
 import { Add, Check, Close, Visibility, Print } from "@mui/icons-material";
 import jsPDF from "jspdf";
 import autoTable from "jspdf-autotable";
+import { apiFetch } from "../api";
 
 const API_URL = process.env.REACT_APP_API_URL;
 
@@ -82,20 +83,24 @@ export const InvoicesTable = ({ invoices, loading, markAsPaid, markAsCancelled,
 
   const generatePDF = async (invoice) => {
       try {
-          // Fetch client details from the API
-          const response = await fetch(`${API_URL}/clients/${invoice.client_id}`, {
-              method: "GET",
-              headers: {
-                  Authorization: `Bearer ${localStorage.getItem("token")}`,
-                  "Content-Type": "application/json",
-              },
-          });
+          // Client details are embedded by GET /invoices?expand=client;
+          // fall back to fetching them for invoices loaded without it
+          let client = invoice.client_details;
+          if (!client) {
+              const response = await apiFetch(`${API_URL}/clients/${invoice.client_id}`, {
+                  method: "GET",
+                  headers: {
+                      Authorization: `Bearer ${localStorage.getItem("token")}`,
+                      "Content-Type": "application/json",
+                  },
+              });
   
-          if (!response.ok) {
-              throw new Error("Failed to fetch client details");
-          }
+              if (!response.ok) {
+                  throw new Error("Failed to fetch client details");
+              }
   
-          const client = await response.json();
+              client = await response.json();
+          }
   
           // Create PDF Document
           const doc = new jsPDF();